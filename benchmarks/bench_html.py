@@ -0,0 +1,94 @@
+"""Сравнение движков разбора HTML на сохранённых страницах Dental First и конкурентов.
+
+    python benchmarks/bench_html.py --repeat 50
+    python benchmarks/bench_html.py --record el_dent_product.html=https://el-dent.ru/...
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+import config
+from html_engine import available_backends
+from parser import DentalFirstParser
+from scraper import CompetitorScraper
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# Фикстура -> сайт конкурента (None - страница товара Dental First)
+FIXTURES = {
+    'dental_first_product.html': None,
+    'el_dent_product.html': 'https://el-dent.ru',
+    'aveldent_product.html': 'https://aveldent.ru',
+    'nika_dent_product.html': 'https://www.nika-dent.ru',
+    'w_stom_product.html': 'https://w-stom.ru',
+}
+
+
+def extract(scraper: CompetitorScraper, competitor, html: str):
+    if competitor is None:
+        return DentalFirstParser._parse_product_page(html, 'fixture')
+    return scraper._parse_product_description(competitor, html)
+
+
+def run(repeat: int):
+    scraper = CompetitorScraper()
+    pages = {}
+    for name in FIXTURES:
+        path = os.path.join(FIXTURES_DIR, name)
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                pages[name] = f.read()
+    if not pages:
+        print(f"No fixtures in {FIXTURES_DIR}, record them with --record")
+        return
+
+    variants = [(backend, partial) for backend in available_backends() for partial in (False, True)]
+    # Эталон - полный разбор html.parser, как было раньше
+    config.CONFIG['html_parser'], config.CONFIG['html_partial'] = 'html.parser', False
+    reference = {name: extract(scraper, FIXTURES[name], html) for name, html in pages.items()}
+
+    print(f"{'fixture':<28}" + ''.join(f"{b + (' partial' if p else ''):>22}" for b, p in variants))
+    totals = {variant: 0.0 for variant in variants}
+    for name, html in pages.items():
+        row = f"{name:<28}"
+        for variant in variants:
+            config.CONFIG['html_parser'], config.CONFIG['html_partial'] = variant
+            result = extract(scraper, FIXTURES[name], html)
+            start = time.perf_counter()
+            for _ in range(repeat):
+                extract(scraper, FIXTURES[name], html)
+            elapsed_ms = (time.perf_counter() - start) * 1000 / repeat
+            totals[variant] += elapsed_ms
+            mark = '' if result == reference[name] else ' !'
+            row += f"{elapsed_ms:>19.2f}ms{mark:<1}"
+        print(row)
+    print(f"{'total ms/page set':<28}" + ''.join(f"{totals[v]:>20.2f}ms" for v in variants))
+    print("'!' - результат отличается от полного разбора html.parser")
+
+
+def record(pairs):
+    session = requests.Session()
+    session.headers.update({'User-Agent': 'Mozilla/5.0 (compatible; Bot/1.0)'})
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    for pair in pairs:
+        name, url = pair.split('=', 1)
+        response = session.get(url, timeout=30)
+        response.raise_for_status()
+        with open(os.path.join(FIXTURES_DIR, name), 'w', encoding='utf-8') as f:
+            f.write(response.text)
+        print(f"Saved {url} -> {name} ({len(response.content)} bytes)")
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="HTML parsing backend benchmark")
+    arg_parser.add_argument('--repeat', type=int, default=20)
+    arg_parser.add_argument('--record', nargs='+', metavar='NAME=URL', help="Сохранить живые страницы как фикстуры")
+    args = arg_parser.parse_args()
+    if args.record:
+        record(args.record)
+    else:
+        run(args.repeat)
@@ -0,0 +1,67 @@
+"""Скорость нормализации символов (TextNormalizer) на больших пачках описаний.
+
+    python benchmarks/bench_normalize.py --count 20000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from formatter import (APOSTROPHE_RE, CHARACTER_TABLE, DEGREE_UNIT_RE, LINE_START_SPACES_RE, SPACES_RE,
+                       TextNormalizer, pair_quotes)
+
+SAMPLES = [
+    "Праймер “Vitremer™” — обеспечивает максимальное сцепление стеклоиономерного материала с тканями зуба.",
+    "Площадь 25 мм², температура хранения от 5° С до 25°С, размер 3×4 см, толщина ±0,5 мм.",
+    "Композит Filtek® Ultimate – «нанонаполненный» материал; прочность на изгиб ≥ 150 МПа, усадка ≤ 2%.",
+    "Набор L’Oreal: ‘щётка’, паста и нить. Подходит для ежедневного ухода — 2 раза в день.",
+    "Обычный текст без специальных символов, который встречается в большинстве описаний конкурентов.",
+]
+
+
+def naive_normalize(text: str, whole_translate: bool = False) -> str:
+    """Те же правила без проверок и с заменой по одному символу за проход - реализация в лоб"""
+    text = APOSTROPHE_RE.sub('ʼ', text)
+    text = pair_quotes(text)
+    text = DEGREE_UNIT_RE.sub(' ', text)
+    if whole_translate:
+        text = text.translate(CHARACTER_TABLE)
+    else:
+        for code, replacement in CHARACTER_TABLE.items():
+            text = text.replace(chr(code), replacement or '')
+    text = text.replace('ʼ', "'")
+    text = SPACES_RE.sub(' ', text)
+    return LINE_START_SPACES_RE.sub('', text)
+
+
+def run(count: int, paragraphs: int):
+    rng = random.Random(1)
+    texts = ['\n'.join(rng.choice(SAMPLES) for _ in range(paragraphs)) for _ in range(count)]
+    size_mb = sum(len(text.encode('utf-8')) for text in texts) / 1024 / 1024
+    normalizer = TextNormalizer()
+
+    results = {}
+    variants = (
+        ('naive replace', naive_normalize),
+        ('whole translate', lambda text: naive_normalize(text, whole_translate=True)),
+        ('TextNormalizer', normalizer.normalize),
+    )
+    for name, normalize in variants:
+        start = time.perf_counter()
+        results[name] = [normalize(text) for text in texts]
+        elapsed = time.perf_counter() - start
+        print(f"{name:<16} {elapsed * 1000:>9.1f}ms  {size_mb / elapsed:>7.1f} MB/s  "
+              f"{count / elapsed:>9.0f} texts/s")
+    same = all(result == results['naive replace'] for result in results.values())
+    print(f"{count} texts, {size_mb:.1f} MB, results match: {same}")
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Text normalization benchmark")
+    arg_parser.add_argument('--count', type=int, default=10000)
+    arg_parser.add_argument('--paragraphs', type=int, default=8, help="Абзацев в одном тексте")
+    args = arg_parser.parse_args()
+    run(args.count, args.paragraphs)
@@ -0,0 +1,143 @@
+"""Сквозной офлайн-прогон process_products на синтетическом каталоге: все внешние сервисы - локальные заглушки.
+
+    python benchmarks/bench_pipeline.py --products 1000
+    python benchmarks/bench_pipeline.py --products 10000 --generate --latency gigachat=1.5 --errors competitors=0.02
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+import main
+from google_sheets import GoogleSheetsHandler
+from metrics import METRICS
+from mock_services import (COMPETITOR_FIXTURES, CompetitorService, DentalFirstService, Faults, FakeSheetsClient,
+                           GigaChatService, SyntheticCatalog)
+
+SERVICES = ('dental-first', 'competitors', 'gigachat', 'sheets')
+DEFAULT_LATENCY = {'dental-first': 0.05, 'competitors': 0.1, 'gigachat': 1.0, 'sheets': 0.3}
+ERROR_STATUSES = {'dental-first': 503, 'competitors': 503, 'gigachat': 429, 'sheets': 429}
+STORES = ('http_cache', 'url_index', 'catalog_index', 'generation_cache', 'job_state', 'delta')
+
+
+def parse_settings(pairs, defaults):
+    settings = dict(defaults)
+    for pair in pairs or []:
+        name, _, value = pair.partition('=')
+        if name not in SERVICES:
+            raise SystemExit(f"Unknown service {name}, expected one of: {', '.join(SERVICES)}")
+        settings[name] = float(value)
+    return settings
+
+
+def configure(args, workdir, dental_first, competitors, gigachat):
+    """Настройки прогона: адреса заглушек, базы во временном каталоге, без ограничения скорости к localhost"""
+    config.CONFIG.update({
+        'dental_first_url': dental_first.catalog_url,
+        'competitors': [service.competitor_url for service in competitors],
+        'gigachat_oauth_url': f'{gigachat.base_url}/oauth',
+        'gigachat_api_url': f'{gigachat.base_url}/completions',
+        'generate': args.generate,
+    })
+    config.CONFIG['catalog_crawl']['enabled'] = False
+    config.CONFIG['generation_stream']['enabled'] = args.stream
+    config.CONFIG['generation_pack']['enabled'] = args.pack
+    for store in STORES:
+        config.CONFIG[store]['path'] = os.path.join(workdir, f'{store}.sqlite')
+    # Все заглушки на 127.0.0.1: без общего лимита скорость упиралась бы в лимит по умолчанию для одного хоста
+    config.CONFIG['rate_limiter']['limits']['127.0.0.1'] = {'rate': args.rate or 1e6, 'burst': 100}
+    config.CONFIG['metrics'].update(summary_path=os.path.join(workdir, 'metrics.json'), prometheus_path=None)
+
+
+def run(args):
+    latency = parse_settings(args.latency, DEFAULT_LATENCY)
+    errors = parse_settings(args.errors, {service: 0.0 for service in SERVICES})
+    faults = {service: Faults(latency[service], errors[service], ERROR_STATUSES[service], seed=number)
+              for number, service in enumerate(SERVICES)}
+
+    catalog = SyntheticCatalog(args.products, args.per_page, args.coverage)
+    dental_first = DentalFirstService(catalog, faults['dental-first'])
+    # У каждого конкурента свои задержки и ошибки с теми же настройками
+    competitors = [CompetitorService(site, catalog, Faults(latency['competitors'], errors['competitors'],
+                                                           ERROR_STATUSES['competitors'], seed=10 + number))
+                   for number, site in enumerate(COMPETITOR_FIXTURES)]
+    gigachat = GigaChatService(faults['gigachat'])
+    sheets_client = FakeSheetsClient(faults['sheets'])
+    names = {dental_first.base_url: 'dental-first', gigachat.base_url: 'gigachat'}
+    names.update({service.base_url: service.site for service in competitors})
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        workdir = args.workdir or temp_dir
+        os.makedirs(workdir, exist_ok=True)
+        configure(args, workdir, dental_first, competitors, gigachat)
+        METRICS.reset()
+        sheets = GoogleSheetsHandler(None, 'bench', client=sheets_client)
+        print(f"{args.products} products, generate: {args.generate}, latency: {latency}, errors: {errors}")
+        start = time.perf_counter()
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+            main.process_products(dental_first.catalog_url, 'bench-key', None, 'bench', sheets=sheets)
+        elapsed = time.perf_counter() - start
+
+    for service in [dental_first, gigachat, *competitors]:
+        service.close()
+    faults.update({service.site: service.faults for service in competitors})
+    report(args, elapsed, names, faults, sheets_client)
+
+
+def report(args, elapsed, names, faults, sheets_client):
+    summary = METRICS.summary()
+    exported = METRICS.counter('pipeline_items_total', stage='export')
+    sheet_rows = sum(max(len(worksheet.rows) - 1, 0) for spreadsheet in sheets_client.spreadsheets.values()
+                     for worksheet in spreadsheet.worksheets.values())
+    print(f"\n{exported:.0f} products exported ({sheet_rows} rows in sheet) in {elapsed:.2f}s: "
+          f"{exported / elapsed:.1f} products/s")
+
+    print(f"\n{'stage':<12}{'calls':>8}{'p50':>10}{'p95':>10}{'max':>10}")
+    for stage in ('scrape', 'generate', 'format', 'export'):
+        latency = METRICS.histogram('pipeline_stage_seconds', stage=stage)
+        if latency:
+            print(f"{stage:<12}{latency['count']:>8}{latency['p50']:>9.3f}s{latency['p95']:>9.3f}s{latency['max']:>9.3f}s")
+
+    print(f"\n{'service':<18}{'requests':>9}{'p50':>10}{'p95':>10}{'MB':>8}{'injected':>10}")
+    for series, latency in sorted(summary['histograms'].get('http_request_seconds', {}).items()):
+        host = series.split('=', 1)[1]
+        name = names.get(f'http://{host}', host)
+        size = METRICS.counter('http_response_bytes_total', host=host) / 1024 / 1024
+        injected = faults[name].errors if name in faults else ''
+        print(f"{name:<18}{latency['count']:>9}{latency['p50']:>9.3f}s{latency['p95']:>9.3f}s{size:>8.1f}{injected:>10}")
+    sheets = METRICS.histogram('sheets_write_seconds', mode=config.CONFIG['sheets'].get('mode', 'append'))
+    if sheets:
+        print(f"{'sheets':<18}{sheets_client.calls:>9}{sheets['p50']:>9.3f}s{sheets['p95']:>9.3f}s{'':>8}"
+              f"{faults['sheets'].errors:>10}")
+
+    print(f"\nTime by activity, s: {summary['seconds_by_activity']}")
+    print(f"Cache hit rate: {summary['cache_hit_rate']}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(dict(summary, products=args.products, elapsed=elapsed, products_per_second=exported / elapsed),
+                      f, ensure_ascii=False, indent=2)
+        print(f"Metrics written to {args.json}")
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Offline end-to-end pipeline benchmark")
+    arg_parser.add_argument('--products', type=int, default=1000, help="Товаров в синтетическом каталоге")
+    arg_parser.add_argument('--per-page', type=int, default=24, help="Товаров на странице каталога")
+    arg_parser.add_argument('--coverage', type=float, default=0.75, help="Доля товаров, которые есть у конкурента")
+    arg_parser.add_argument('--generate', action='store_true', help="Генерировать описания (заглушка GigaChat)")
+    arg_parser.add_argument('--stream', action='store_true', help="Потоковые ответы GigaChat")
+    arg_parser.add_argument('--pack', action='store_true', help="Несколько товаров в одном запросе к GigaChat")
+    arg_parser.add_argument('--latency', nargs='+', metavar='SERVICE=SECONDS',
+                            help=f"Задержка ответа сервиса: {', '.join(SERVICES)}")
+    arg_parser.add_argument('--errors', nargs='+', metavar='SERVICE=RATE', help="Доля ответов с ошибкой (503/429)")
+    arg_parser.add_argument('--rate', type=float, default=0, help="Запросов в секунду к одному хосту (0 - без ограничения)")
+    arg_parser.add_argument('--workdir', help="Каталог для баз (кэши, индексы); по умолчанию временный - холодный прогон")
+    arg_parser.add_argument('--json', help="Сохранить метрики прогона в JSON")
+    arg_parser.add_argument('--verbose', action='store_true', help="Показывать вывод process_products")
+    run(arg_parser.parse_args())
@@ -0,0 +1,399 @@
+"""Локальные заглушки всех внешних сервисов для офлайн-бенчмарка: Dental First, сайты конкурентов, GigaChat и Google Sheets.
+
+Страницы товаров - сохранённые страницы из benchmarks/fixtures, в которые подставляются артикул, ID и название
+синтетического товара; страницы каталога и поиска собираются в той же разметке, что и на настоящих сайтах.
+У каждого сервиса своя задержка ответа и доля ошибок (Faults).
+"""
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import gspread
+import requests
+from gspread.utils import a1_to_rowcol
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+COMPETITOR_FIXTURES = {
+    'el-dent.ru': 'el_dent_product.html',
+    'aveldent.ru': 'aveldent_product.html',
+    'www.nika-dent.ru': 'nika_dent_product.html',
+    'w-stom.ru': 'w_stom_product.html',
+}
+# Название и коды товара в сохранённых страницах - заменяются на данные синтетического товара
+FIXTURE_NAME = 'Adper Single Bond 2'
+FIXTURE_ARTICLE = '51202'
+FIXTURE_ID = '418522'
+FIXTURE_CODE = '100234'
+OG_URL_RE = re.compile(r'(property="og:url" content=")[^"]*(")')
+PRODUCT_NAMES = ('Адгезив', 'Композит', 'Праймер', 'Бонд', 'Цемент', 'Герметик', 'Гель для травления', 'Матрица')
+
+
+def _read_fixture(name: str) -> str:
+    with open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as f:
+        return f.read()
+
+
+class Faults:
+    """Задержка ответа (latency ± доля jitter) и доля ответов с ошибкой error_status"""
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, error_status: int = 503, jitter: float = 0.5,
+                 seed: int = 1):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.jitter = jitter
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self) -> float:
+        with self._lock:
+            return self.latency * self._random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def should_fail(self) -> bool:
+        with self._lock:
+            failed = self._random.random() < self.error_rate
+            self.errors += failed
+            return failed
+
+
+class SyntheticCatalog:
+    """Номер товара 0..products-1 -> артикул, ID и название; у каких конкурентов есть товар, задаёт coverage"""
+
+    def __init__(self, products: int, per_page: int = 24, coverage: float = 0.75):
+        self.products = products
+        self.per_page = per_page
+        self.coverage = coverage
+
+    @staticmethod
+    def article(number: int) -> str:
+        return f'BN{number:06d}'
+
+    @staticmethod
+    def number(article: str) -> Optional[int]:
+        return int(article[2:]) if re.fullmatch(r'BN\d{6}', article) else None
+
+    @staticmethod
+    def name(number: int) -> str:
+        return f'{PRODUCT_NAMES[number % len(PRODUCT_NAMES)]} Bench-{number}'
+
+    def exists(self, number: Optional[int]) -> bool:
+        return number is not None and 0 <= number < self.products
+
+    def has_competitor(self, number: int, site: str) -> bool:
+        digest = hashlib.md5(f'{site}:{number}'.encode('utf-8')).digest()
+        return digest[0] < 256 * self.coverage
+
+
+class MockService:
+    """Сервис на отдельном порту: respond(method, path, body) -> (статус, заголовки, тело или список частей потока)"""
+
+    def __init__(self, faults: Optional[Faults] = None):
+        self.faults = faults or Faults()
+        self.requests = 0
+        self._lock = threading.Lock()
+        self.server = _Server(('127.0.0.1', 0), _Handler)
+        self.server.daemon_threads = True
+        self.server.service = self
+        self.base_url = f'http://127.0.0.1:{self.server.server_port}'
+        self._thread = threading.Thread(target=self.server.serve_forever, name=type(self).__name__, daemon=True)
+        self._thread.start()
+
+    def respond(self, method: str, path: str, body: bytes) -> Tuple[int, Dict[str, str], bytes | List[bytes]]:
+        raise NotImplementedError
+
+    @staticmethod
+    def html(text: str) -> Tuple[int, Dict[str, str], bytes]:
+        return 200, {'Content-Type': 'text/html; charset=utf-8'}, text.encode('utf-8')
+
+    @staticmethod
+    def not_found() -> Tuple[int, Dict[str, str], bytes]:
+        return 404, {'Content-Type': 'text/plain'}, b'not found'
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class _Server(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # Клиент закрыл соединение после ответа с ошибкой - для заглушки это норма, а не повод печатать traceback
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return
+        super().handle_error(request, client_address)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, как у настоящих сайтов
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def _dispatch(self, method: str):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        service = self.server.service
+        with service._lock:
+            service.requests += 1
+        delay = service.faults.delay()
+        if service.faults.should_fail():
+            status, headers, content = service.faults.error_status, {'Retry-After': '0'}, b'injected error'
+        else:
+            status, headers, content = service.respond(method, self.path, body)
+
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if isinstance(content, list):
+            # Поток (SSE): задержка распределяется между частями ответа, первые части приходят сразу
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            self.close_connection = True
+            for chunk in content:
+                time.sleep(delay / len(content))
+                self.wfile.write(chunk)
+                self.wfile.flush()
+            return
+        time.sleep(delay)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class DentalFirstService(MockService):
+    """Каталог /catalog/?PAGEN_1=N и страницы товаров /catalog/product-N/"""
+
+    def __init__(self, catalog: SyntheticCatalog, faults: Optional[Faults] = None):
+        self.catalog = catalog
+        self.template = _read_fixture('dental_first_product.html')
+        super().__init__(faults)
+
+    @property
+    def catalog_url(self) -> str:
+        return f'{self.base_url}/catalog/'
+
+    def respond(self, method: str, path: str, body: bytes):
+        parts = urlsplit(path)
+        match = re.fullmatch(r'/catalog/product-(\d+)/', parts.path)
+        if match and self.catalog.exists(int(match.group(1))):
+            return self.html(self.product_page(int(match.group(1))))
+        if parts.path == '/catalog/':
+            page = int(parse_qs(parts.query).get('PAGEN_1', ['1'])[0])
+            return self.html(self.catalog_page(page))
+        return self.not_found()
+
+    def catalog_page(self, page: int) -> str:
+        first = (page - 1) * self.catalog.per_page
+        cards = ''.join(
+            f'<div class="set-card block"><a class="di_b c_b" href="/catalog/product-{number}/">'
+            f'{self.catalog.name(number)}</a></div>'
+            for number in range(first, min(first + self.catalog.per_page, self.catalog.products))
+        )
+        pagination = ''
+        if first + self.catalog.per_page < self.catalog.products:
+            pagination = f'<a class="pagination__next" href="/catalog/?PAGEN_1={page + 1}">Далее</a>'
+        return (f'<html><head><title>Каталог</title></head><body>'
+                f'<div class="set-row block-card ajaxelem">{cards}</div>{pagination}</body></html>')
+
+    def product_page(self, number: int) -> str:
+        page = OG_URL_RE.sub(rf'\g<1>{self.base_url}/catalog/product-{number}/\g<2>', self.template)
+        return (page.replace(FIXTURE_NAME, self.catalog.name(number))
+                .replace(FIXTURE_ARTICLE, self.catalog.article(number))
+                .replace(FIXTURE_ID, str(500000 + number))
+                .replace(FIXTURE_CODE, str(700000 + number)))
+
+
+class CompetitorService(MockService):
+    """Поиск и страницы товаров одного конкурента; адрес конкурента - base_url/<домен>, чтобы сработал разбор по домену"""
+
+    def __init__(self, site: str, catalog: SyntheticCatalog, faults: Optional[Faults] = None):
+        self.site = site
+        self.catalog = catalog
+        self.template = _read_fixture(COMPETITOR_FIXTURES[site])
+        super().__init__(faults)
+
+    @property
+    def competitor_url(self) -> str:
+        return f'{self.base_url}/{self.site}'
+
+    def respond(self, method: str, path: str, body: bytes):
+        parts = urlsplit(path)
+        query = parse_qs(parts.query)
+        match = re.fullmatch(rf'/{re.escape(self.site)}/product/(\w+)/', parts.path)
+        if match:
+            number = self.catalog.number(match.group(1))
+            if self.catalog.exists(number) and self.catalog.has_competitor(number, self.site):
+                return self.html(self.product_page(number))
+            return self.not_found()
+        for name in ('words', 'search', 'q'):
+            if name in query:
+                return self.html(self.search_page(query[name][0]))
+        return self.not_found()
+
+    def product_page(self, number: int) -> str:
+        return self.template.replace(FIXTURE_NAME, self.catalog.name(number)).replace(
+            FIXTURE_ARTICLE, self.catalog.article(number))
+
+    def search_page(self, article: str) -> str:
+        number = self.catalog.number(article)
+        found = self.catalog.exists(number) and self.catalog.has_competitor(number, self.site)
+        cards = self.search_card(number) if found else ''
+        return f'<html><head><title>Поиск</title></head><body>{cards}</body></html>'
+
+    def search_card(self, number: int) -> str:
+        # Разметка карточек - как в CompetitorScraper._find_product_page для каждого сайта
+        article, name = self.catalog.article(number), self.catalog.name(number)
+        url = f'{self.competitor_url}/product/{article}/'
+        if self.site == 'el-dent.ru':
+            return f'<div class="col --product-card"><a class="product__caption" href="{url}">{name} ({article})</a></div>'
+        if self.site == 'aveldent.ru':
+            return (f'<div class="product-thumb transition"><meta itemprop="mpn" content="{article}">'
+                    f'<a itemprop="url" href="{url}">{name}</a></div>')
+        if self.site == 'www.nika-dent.ru':
+            return (f'<div class="product-item loadmore_item"><div class="descr-block">{name} {article}</div>'
+                    f'<div class="item-manufacturer"><a class="item-link" href="{url}">3M</a></div></div>')
+        return f'<div class="productTable"><div class="productColText"><a class="name" href="{url}">{name}</a></div></div>'
+
+
+class GigaChatService(MockService):
+    """OAuth (/oauth) и completions (/completions): обычный ответ, поток SSE и JSON-ответ на пакет товаров"""
+
+    def __init__(self, faults: Optional[Faults] = None, text_chars: int = 1500, stream_chunks: int = 40):
+        self.text_chars = text_chars
+        self.stream_chunks = stream_chunks
+        super().__init__(faults)
+
+    def respond(self, method: str, path: str, body: bytes):
+        if method == 'POST' and path == '/oauth':
+            expires_at = int((time.time() + 1800) * 1000)
+            return self.json({'access_token': 'bench-token', 'expires_at': expires_at})
+        if method == 'POST' and path == '/completions':
+            request = json.loads(body)
+            prompt = request['messages'][-1]['content']
+            products = len(re.findall(r'^\s*Товар \d+:', prompt, re.MULTILINE))
+            usage = {'prompt_tokens': len(prompt) // 4, 'completion_tokens': self.text_chars // 4}
+            if products:
+                items = [dict(self.fields(), id=position) for position in range(1, products + 1)]
+                return self.json(self.completion(json.dumps(items, ensure_ascii=False), usage))
+            content = '\n'.join(f'{label}: {value}' for label, value in zip(
+                ('Title', 'Description', 'Keywords', 'Text'), self.fields().values()))
+            if request.get('stream'):
+                return 200, {'Content-Type': 'text/event-stream'}, self.sse(content)
+            return self.json(self.completion(content, usage))
+        return self.not_found()
+
+    def fields(self) -> Dict[str, str]:
+        sentence = 'Материал обеспечивает надёжное сцепление и удобен в работе. '
+        return {
+            'title': 'Адгезив для прямых реставраций',
+            'meta_description': 'Однокомпонентный адгезив с высокой прочностью сцепления.',
+            'keywords': 'адгезив, бонд, реставрация, стоматология, 3M',
+            'text': (sentence * (self.text_chars // len(sentence) + 1))[:self.text_chars],
+        }
+
+    @staticmethod
+    def completion(content: str, usage: Dict[str, int]) -> Dict:
+        return {'choices': [{'message': {'role': 'assistant', 'content': content}}], 'usage': usage}
+
+    def sse(self, content: str) -> List[bytes]:
+        size = max(1, len(content) // self.stream_chunks)
+        chunks = [
+            b'data: ' + json.dumps({'choices': [{'delta': {'content': content[start:start + size]}}]},
+                                   ensure_ascii=False).encode('utf-8') + b'\n\n'
+            for start in range(0, len(content), size)
+        ]
+        return chunks + [b'data: [DONE]\n\n']
+
+    @staticmethod
+    def json(data: Dict) -> Tuple[int, Dict[str, str], bytes]:
+        return 200, {'Content-Type': 'application/json'}, json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+
+class FakeSheetsClient:
+    """Заменяет gspread.Client в GoogleSheetsHandler: листы в памяти, задержка и ошибки квоты (429) через Faults"""
+
+    def __init__(self, faults: Optional[Faults] = None):
+        self.faults = faults or Faults(error_status=429)
+        self.calls = 0
+        self.spreadsheets = {}
+        self._lock = threading.Lock()
+
+    def call(self):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.faults.delay())
+        if self.faults.should_fail():
+            response = requests.Response()
+            response.status_code = self.faults.error_status
+            response._content = json.dumps({'error': {'code': self.faults.error_status, 'message': 'Quota exceeded',
+                                                      'status': 'RESOURCE_EXHAUSTED'}}).encode('utf-8')
+            raise gspread.exceptions.APIError(response)
+
+    def open_by_key(self, key: str) -> 'FakeSpreadsheet':
+        self.call()
+        return self.spreadsheets.setdefault(key, FakeSpreadsheet(self))
+
+
+class FakeSpreadsheet:
+    def __init__(self, client: FakeSheetsClient):
+        self.client = client
+        self.worksheets = {}
+
+    def worksheet(self, title: str) -> 'FakeWorksheet':
+        self.client.call()
+        if title not in self.worksheets:
+            raise gspread.exceptions.WorksheetNotFound(title)
+        return self.worksheets[title]
+
+    def add_worksheet(self, title: str, rows: int, cols: int) -> 'FakeWorksheet':
+        self.client.call()
+        self.worksheets[title] = FakeWorksheet(self.client)
+        return self.worksheets[title]
+
+
+class FakeWorksheet:
+    def __init__(self, client: FakeSheetsClient):
+        self.client = client
+        self.rows = []
+
+    def update(self, values: List[List[str]], range_name: str = 'A1', **kwargs):
+        self.client.call()
+        self._write(range_name, values)
+
+    def batch_update(self, data: List[Dict], **kwargs):
+        self.client.call()
+        for update in data:
+            self._write(update['range'], update['values'])
+
+    def append_rows(self, values: List[List[str]], **kwargs):
+        self.client.call()
+        self.rows.extend(list(row) for row in values)
+
+    def get_all_values(self) -> List[List[str]]:
+        self.client.call()
+        return [list(row) for row in self.rows]
+
+    def _write(self, cell: str, values: List[List[str]]):
+        first_row, first_col = a1_to_rowcol(cell.split(':')[0])
+        for row_offset, row_values in enumerate(values):
+            while len(self.rows) < first_row + row_offset:
+                self.rows.append([])
+            row = self.rows[first_row + row_offset - 1]
+            for col_offset, value in enumerate(row_values):
+                column = first_col + col_offset - 1
+                row.extend([''] * (column + 1 - len(row)))
+                row[column] = value
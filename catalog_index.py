@@ -0,0 +1,154 @@
+import re
+import sqlite3
+import threading
+import time
+import xml.etree.ElementTree as ElementTree
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+from html_engine import make_soup
+from parser import find_next_page
+import config
+
+
+def contains_article(label: str, article: str) -> bool:
+    # Артикул - отдельное слово в названии: 123 не совпадает с 1234 или 123-45
+    return re.search(rf'(?<![\w\-./]){re.escape(article)}(?![\w\-/]|\.\w)', label) is not None
+
+
+class CatalogIndex:
+    """Локальная таблица артикулов из каталогов конкурентов, собранная заранее обходом сайтов"""
+
+    def __init__(self, path: str, fallback_to_search: bool = True):
+        self.path = path
+        self.fallback_to_search = fallback_to_search
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS catalog_items ('
+            'competitor TEXT, label TEXT, url TEXT, exact INTEGER, '
+            'PRIMARY KEY (competitor, url))'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS catalog_items_label ON catalog_items (competitor, label)')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS crawled_competitors (competitor TEXT PRIMARY KEY, crawled_at REAL)')
+        self._conn.commit()
+
+    @classmethod
+    def from_config(cls) -> Optional['CatalogIndex']:
+        settings = config.CONFIG.get('catalog_index', {})
+        if not settings.get('enabled'):
+            return None
+        return cls(settings.get('path', 'catalog_index.sqlite'), settings.get('fallback_to_search', True))
+
+    def has_competitor(self, competitor: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT 1 FROM crawled_competitors WHERE competitor = ?', (competitor,)
+            ).fetchone()
+        return row is not None
+
+    def resolve(self, competitor: str, article: str) -> Optional[str]:
+        with self._lock:
+            # Точное совпадение (aveldent.ru отдаёт артикул в itemprop="mpn")
+            row = self._conn.execute(
+                'SELECT url FROM catalog_items WHERE competitor = ? AND exact = 1 AND label = ?', (competitor, article)
+            ).fetchone()
+            if row is not None:
+                return row[0]
+            # Остальные сайты: артикул должен быть отдельным словом в названии товара
+            rows = self._conn.execute(
+                'SELECT label, url FROM catalog_items WHERE competitor = ? AND exact = 0 AND instr(label, ?) > 0',
+                (competitor, article)
+            ).fetchall()
+        return next((url for label, url in rows if contains_article(label, article)), None)
+
+    def replace_competitor(self, competitor: str, items: Iterable[Tuple[str, str, bool]]):
+        with self._lock:
+            with self._conn:
+                self._conn.execute('DELETE FROM catalog_items WHERE competitor = ?', (competitor,))
+                self._conn.executemany(
+                    'INSERT OR REPLACE INTO catalog_items VALUES (?, ?, ?, ?)',
+                    [(competitor, label, url, int(exact)) for label, url, exact in items]
+                )
+                self._conn.execute('INSERT OR REPLACE INTO crawled_competitors VALUES (?, ?)', (competitor, time.time()))
+
+    def count(self, competitor: str) -> int:
+        with self._lock:
+            return self._conn.execute(
+                'SELECT COUNT(*) FROM catalog_items WHERE competitor = ?', (competitor,)
+            ).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class CatalogIndexBuilder:
+    """Обходит sitemap или страницы категорий конкурента и заполняет CatalogIndex"""
+
+    def __init__(self, scraper, index: CatalogIndex):
+        self.scraper = scraper
+        self.index = index
+        settings = config.CONFIG.get('catalog_index', {})
+        self.sources: Dict[str, List[str]] = settings.get('sources', {})
+        self.max_pages = settings.get('max_pages', 500)
+
+    def build(self, competitors: Optional[List[str]] = None) -> Dict[str, int]:
+        competitors = competitors or config.CONFIG['competitors']
+        if self.scraper.executor:
+            futures = {c: self.scraper.executor.submit(self.build_competitor, c) for c in competitors}
+            return {competitor: future.result() for competitor, future in futures.items()}
+        return {competitor: self.build_competitor(competitor) for competitor in competitors}
+
+    def build_competitor(self, competitor: str) -> int:
+        try:
+            start_urls = self.sources.get(competitor) or self._read_sitemap(f"{competitor}/sitemap.xml")
+            items = self._crawl(competitor, start_urls)
+            if not items:
+                print(f"No catalog items found on {competitor}, index not updated")
+                return 0
+            self.index.replace_competitor(competitor, items)
+            print(f"Indexed {len(items)} products on {competitor}")
+            return len(items)
+        except Exception as e:
+            print(f"Error building catalog index for {competitor}: {str(e)}")
+            return 0
+
+    def _crawl(self, competitor: str, start_urls: List[str]) -> List[Tuple[str, str, bool]]:
+        frontier = deque(start_urls)
+        visited = set()
+        items = {}
+        while frontier and len(visited) < self.max_pages:
+            url = frontier.popleft()
+            if url in visited:
+                continue
+            visited.add(url)
+            try:
+                response = self.scraper.fetch(url)
+                response.raise_for_status()
+                soup = make_soup(response.text)
+            except Exception as e:
+                print(f"Error crawling {url}: {str(e)}")
+                continue
+
+            page_items = self.scraper.extract_catalog_items(soup, competitor)
+            for label, product_url, exact in page_items:
+                items[product_url] = (label, product_url, exact)
+
+            # Пагинацию обходим только у страниц, где нашлись карточки товаров
+            next_url = find_next_page(soup, url) if page_items else None
+            if next_url and next_url not in visited:
+                frontier.append(next_url)
+        return list(items.values())
+
+    def _read_sitemap(self, url: str) -> List[str]:
+        response = self.scraper.fetch(url)
+        response.raise_for_status()
+        root = ElementTree.fromstring(response.content)
+        locations = [elem.text.strip() for elem in root.iter() if elem.tag.endswith('loc') and elem.text]
+        if root.tag.endswith('sitemapindex'):
+            urls = []
+            for location in locations:
+                urls.extend(self._read_sitemap(location))
+            return urls
+        return locations
@@ -9,8 +9,136 @@ CONFIG = {
     ],
     "client_id": "0920ea8f-924d-4064-9ab3-5158ae331b64",
     "client_secret": "",
+    "gigachat_oauth_url": "https://ngw.devices.sberbank.ru:9443/api/v2/oauth",
+    "gigachat_api_url": "https://gigachat.devices.sberbank.ru/api/v1/completions",
+    "gigachat_scope": "GIGACHAT_API_PERS",
+    "gigachat_model": "GigaChat",
+    "generate": False,  # Генерировать новые описания через GigaChat
+    "generation_concurrency": 4,  # Одновременных запросов к GigaChat
+    "generation_retries": 3,  # Повторы при 429 и ошибках 5xx
+    "generation_backoff": 2.0,  # Начальная пауза между повторами, секунды
+    "normalize_text": True,  # Замена тире, кавычек, ®, ², °, ×, ± и т.п. во входных текстах и ответах GigaChat
+    "generation_stream": {  # Потоковый ответ GigaChat (SSE): поля разбираются по мере генерации
+        "enabled": False,
+        "abort_after_chars": 300,  # Прерывать ответ, если за столько символов не появился "Title:"
+        "max_field_chars": 500,  # Прерывать ответ, если Title/Description/Keywords длиннее (нет перевода строки)
+    },
+    "generation_pack": {  # Несколько коротких товаров в одном запросе к GigaChat (ответ в JSON)
+        "enabled": False,
+        "max_products": 5,  # Товаров в одном запросе
+        "max_source_chars": 1500,  # Более длинные тексты генерируются отдельными запросами
+    },
+    "dedup": {  # Удаление почти одинаковых предложений из описаний конкурентов перед генерацией
+        "enabled": True,
+        "threshold": 0.8,  # Сходство по Жаккару (шинглы из 3 слов), начиная с которого предложение считается повтором
+        "token_budget": 1500,  # Максимум токенов входного текста в промпте; сначала сокращаются менее важные поля
+        "chars_per_token": 3.5,  # Оценка числа символов на токен для русского текста
+    },
+    "generation_cache": {
+        "enabled": True,
+        "path": "generation_cache.sqlite",
+        "max_bytes": 200 * 1024 * 1024,  # При превышении удаляются давно не использованные описания
+        "force": False,  # Всегда генерировать заново (то же, что --force-regenerate)
+    },
+    "catalog_crawl": {  # Обход всего каталога Dental First по нескольким категориям вместо dental_first_url
+        "enabled": False,
+        "roots": [],  # Адреса категорий; если пусто - берутся из меню каталога на странице discover_from
+        "discover_from": "https://dental-first.ru/catalog/",
+        "navigation_selector": ".catalog-menu a[href], nav a[href*=\"/catalog/\"]",
+        "max_pages": None,  # Ограничение страниц на категорию
+    },
+    "job_state": {  # Состояние этапов по каждому товару для продолжения прерванного прогона (--resume)
+        "enabled": True,
+        "path": "job_state.sqlite",
+    },
+    "delta": {  # Обрабатывать только товары, содержимое которых изменилось с прошлого прогона
+        "enabled": False,
+        "path": "fingerprints.sqlite",
+        "recheck_competitors": True,  # Для неизменившихся товаров всё равно проверять описания конкурентов
+    },
+    "pipeline": {  # Каталог -> конкуренты -> генерация -> оформление -> выгрузка, этапы работают одновременно
+        "queue_size": 20,  # Очередь между этапами: при заполнении предыдущий этап ждёт
+        "workers": {"scrape": 4, "generate": 4, "format": 1},  # Потоков на этап
+    },
+    "work_queue": {  # Распределённый режим: --enqueue, затем несколько --worker, затем --merge
+        "path": "work_queue.sqlite",  # Общий файл очереди; может лежать на общем сетевом диске
+        "shards": 16,  # Товары делятся на шарды по хэшу артикула, воркеру можно указать --shards
+        "lease_seconds": 600,  # Аренда товара воркером; после истечения товар заберёт другой воркер
+        "claim_size": 20,  # Товаров за одно обращение воркера к очереди
+        "max_attempts": 3,  # После стольких неудач товар помечается как failed
+    },
+    "metrics": {  # Счётчики и гистограммы задержек по этапам, сайтам и видам работы (HTTP, разбор HTML, GigaChat)
+        "enabled": True,
+        "summary_path": "metrics.json",  # JSON-сводка в конце прогона
+        "prometheus_path": None,  # Текстовый файл для Prometheus (node_exporter textfile), например "metrics.prom"
+        "prometheus_interval": 15,  # Как часто обновлять файл Prometheus во время прогона, секунды
+    },
     "google_creds_file": "credentials.json",
     "spreadsheet_id": "",
+    "sheets": {
+        "mode": "upsert",  # upsert - обновлять строки с тем же DF ID, append - всегда дописывать
+        "key": "DF ID",  # Столбец, по которому строки сопоставляются в режиме upsert
+        "flush_rows": 50,  # Строки дописываются в таблицу пачками по столько строк
+        "flush_seconds": 30,  # ... или не реже, чем раз в столько секунд
+        "expected_rows": 1000,  # Размер нового листа, если число строк заранее неизвестно
+        "retries": 5,  # Повторы при превышении квоты Sheets API (429) и ошибках 5xx
+        "backoff": 2.0,  # Начальная пауза между повторами, секунды
+    },
     "max_products": 20,  # Ограничение для тестов
-    "request_delay": (1, 3)  # Задержка между запросами
+    "request_delay": (1, 3),  # Задержка между запросами
+    "competitor_workers": 8,  # Общий пул потоков для запросов к конкурентам (1 - последовательно)
+    "per_host_concurrency": 2,  # Максимум одновременных запросов к одному сайту
+    "parser_workers": 8,  # Потоки для загрузки страниц товаров Dental First (1 - последовательно)
+    "parser_processes": 0,  # Процессы для разбора HTML (0 - разбор в потоках загрузки)
+    "transport": {
+        "timeout": (5, 30),  # (подключение, чтение) в секундах
+        "pool_maxsize": 10,  # Соединений keep-alive на один хост
+        "retries": 3,  # Повторы при сетевых ошибках и 500/502/504 (только GET)
+        "backoff_factor": 0.5,
+        "hosts": {  # Отдельные настройки пулов и таймаутов по хостам
+            "dental-first.ru": {"pool_maxsize": 16},
+            "gigachat.devices.sberbank.ru": {"pool_maxsize": 16, "timeout": (5, 120)},
+        },
+    },
+    "rate_limiter": {
+        "limits": {  # Запросов в секунду и размер "пачки" для каждого сайта
+            "default": {"rate": 0.5, "burst": 1},
+            "dental-first.ru": {"rate": 4, "burst": 4},
+            "aveldent.ru": {"rate": 1, "burst": 2},
+            "el-dent.ru": {"rate": 1, "burst": 2},
+            "www.nika-dent.ru": {"rate": 1, "burst": 2},
+            "w-stom.ru": {"rate": 0.5, "burst": 1},
+            "ngw.devices.sberbank.ru": {"rate": 1, "burst": 2},
+            "gigachat.devices.sberbank.ru": {"rate": 10, "burst": 10},
+        },
+        "jitter": 0.3,  # Случайная добавка к интервалу, доля от 1/rate
+        "backoff_factor": 0.5,  # Во сколько раз снижать скорость после 429/503
+        "recovery": 0.05,  # На какую долю исходной скорости разгоняться после успешного ответа
+        "min_rate": 0.05,
+        "throttle_retries": 2,  # Повторы запроса после 429/503 (с учётом Retry-After)
+    },
+    "html_parser": "auto",  # auto | html.parser | lxml | selectolax (auto - lxml, если установлен)
+    "html_partial": False,  # Разбирать только <meta> и нужные блоки страниц товаров
+    "http_cache": {
+        "enabled": True,
+        "path": "http_cache.sqlite",
+        "default_ttl": 24 * 3600,  # Сколько секунд ответ считается свежим без перепроверки
+        "ttl": {  # TTL по доменам, 0 - всегда перепроверять через ETag/Last-Modified
+            "dental-first.ru": 6 * 3600,
+        },
+    },
+    "url_index": {
+        "enabled": True,
+        "path": "url_index.sqlite",
+        "negative_ttl": 7 * 24 * 3600,  # Сколько помнить, что товара нет у конкурента
+    },
+    "catalog_index": {
+        "enabled": True,
+        "path": "catalog_index.sqlite",
+        "fallback_to_search": True,  # Искать через поиск сайта, если артикула нет в собранном каталоге (обход мог быть неполным)
+        "max_pages": 500,  # Ограничение обхода на одного конкурента
+        "sources": {  # Стартовые страницы каталогов; если не заданы - берётся /sitemap.xml
+            # "https://aveldent.ru": ["https://aveldent.ru/stomatologicheskie-materiali/"],
+        },
+    },
 }
\ No newline at end of file
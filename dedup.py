@@ -0,0 +1,131 @@
+import random
+import re
+import threading
+import zlib
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+import config
+
+SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?…])\s*(?=[А-ЯЁA-Z«"(])')
+WORD_RE = re.compile(r'\w+')
+MERSENNE_PRIME = (1 << 61) - 1
+# Сначала идёт самое содержательное поле: при повторе остаётся его вариант
+FIELD_PRIORITY = ('basic_description', 'top_description', 'h2', 'meta_description', 'meta_title')
+
+
+class SentenceDeduplicator:
+    """Удаляет почти одинаковые предложения из описаний конкурентов (шинглы слов + MinHash/LSH)"""
+
+    def __init__(self, threshold: float = 0.8, shingle_size: int = 3, bands: int = 8, rows: int = 4,
+                 token_budget: Optional[int] = None, chars_per_token: float = 3.5):
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.bands = bands
+        self.rows = rows
+        self.token_budget = token_budget
+        self.chars_per_token = chars_per_token
+        rng = random.Random(42)
+        self._permutations = [(rng.randrange(1, MERSENNE_PRIME), rng.randrange(0, MERSENNE_PRIME))
+                              for _ in range(bands * rows)]
+        self.totals = defaultdict(int)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls) -> Optional['SentenceDeduplicator']:
+        settings = config.CONFIG.get('dedup', {})
+        if not settings.get('enabled'):
+            return None
+        return cls(
+            threshold=settings.get('threshold', 0.8),
+            shingle_size=settings.get('shingle_size', 3),
+            token_budget=settings.get('token_budget'),
+            chars_per_token=settings.get('chars_per_token', 3.5),
+        )
+
+    def deduplicate(self, combined: Dict[str, str]) -> Tuple[Dict[str, str], Dict[str, int]]:
+        result = dict(combined)
+        stats = defaultdict(int)
+        kept_shingles: List[Set[str]] = []
+        buckets = defaultdict(list)
+        fields = {}
+
+        for field in FIELD_PRIORITY:
+            if not combined.get(field):
+                continue
+            stats['chars_before'] += len(combined[field])
+            paragraphs = []
+            for paragraph in combined[field].split('\n'):
+                sentences = []
+                for sentence in SENTENCE_SPLIT_RE.split(paragraph.strip()):
+                    sentence = sentence.strip()
+                    if not sentence:
+                        continue
+                    stats['sentences'] += 1
+                    shingles = self._shingles(sentence)
+                    signature = self._signature(shingles)
+                    band_keys = [(band, tuple(signature[band * self.rows:(band + 1) * self.rows]))
+                                 for band in range(self.bands)]
+                    if self._is_duplicate(shingles, band_keys, buckets, kept_shingles):
+                        stats['duplicates_removed'] += 1
+                        continue
+                    for key in band_keys:
+                        buckets[key].append(len(kept_shingles))
+                    kept_shingles.append(shingles)
+                    sentences.append(sentence)
+                if sentences:
+                    paragraphs.append(sentences)
+            fields[field] = paragraphs
+
+        self._apply_budget(fields, stats)
+        for field, paragraphs in fields.items():
+            result[field] = '\n'.join(' '.join(sentences) for sentences in paragraphs)
+            stats['chars_after'] += len(result[field])
+
+        with self._lock:
+            for key, value in stats.items():
+                self.totals[key] += value
+        return result, dict(stats)
+
+    def _apply_budget(self, fields: Dict[str, List[List[str]]], stats: Dict[str, int]):
+        if not self.token_budget:
+            return
+        budget_chars = int(self.token_budget * self.chars_per_token)
+        total = sum(len(' '.join(sentences)) + 1 for paragraphs in fields.values() for sentences in paragraphs)
+        # Срезаем хвостовые предложения, начиная с наименее важного поля; первое предложение поля всегда остаётся
+        for field in reversed(FIELD_PRIORITY):
+            paragraphs = fields.get(field) or []
+            while total > budget_chars and (len(paragraphs) > 1 or paragraphs and len(paragraphs[0]) > 1):
+                sentence = paragraphs[-1].pop()
+                total -= len(sentence) + 1
+                stats['truncated_sentences'] += 1
+                if not paragraphs[-1]:
+                    paragraphs.pop()
+            if total <= budget_chars:
+                break
+
+    def _is_duplicate(self, shingles: Set[str], band_keys, buckets, kept_shingles: List[Set[str]]) -> bool:
+        candidates = {index for key in band_keys for index in buckets.get(key, ())}
+        for index in candidates:
+            other = kept_shingles[index]
+            if len(shingles & other) / len(shingles | other) >= self.threshold:
+                return True
+        return False
+
+    def _shingles(self, sentence: str) -> Set[str]:
+        words = WORD_RE.findall(sentence.lower())
+        if len(words) < self.shingle_size:
+            return {' '.join(words)}
+        return {' '.join(words[i:i + self.shingle_size]) for i in range(len(words) - self.shingle_size + 1)}
+
+    def _signature(self, shingles: Set[str]) -> List[int]:
+        hashes = [zlib.crc32(shingle.encode('utf-8')) for shingle in shingles]
+        return [min((a * h + b) % MERSENNE_PRIME for h in hashes) for a, b in self._permutations]
+
+    def report(self) -> Dict[str, float]:
+        with self._lock:
+            totals = dict(self.totals)
+        before = totals.get('chars_before', 0)
+        after = totals.get('chars_after', 0)
+        totals['removed_share'] = 1 - after / before if before else 0.0
+        totals['tokens_saved'] = int((before - after) / self.chars_per_token)
+        return totals
@@ -0,0 +1,88 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Optional
+import config
+
+# Поля товара Dental First, изменение которых требует заново собрать и сгенерировать описание
+SOURCE_FIELDS = ('nomenclature', 'meta_title', 'meta_keywords', 'meta_description', 'basic_description')
+
+
+def fingerprint(data: Dict, fields: Optional[tuple] = None) -> str:
+    values = [data.get(field) for field in fields] if fields else sorted(data.items())
+    return hashlib.sha256(json.dumps(values, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class DeltaTracker:
+    """Отпечатки содержимого товаров между прогонами: неизменившиеся товары не обрабатываются заново"""
+
+    def __init__(self, path: str, recheck_competitors: bool = True):
+        self.path = path
+        self.recheck_competitors = recheck_competitors
+        self.counts = defaultdict(int)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS fingerprints ('
+            'product_id TEXT PRIMARY KEY, source TEXT, competitors TEXT, updated_at REAL)'
+        )
+        self._conn.commit()
+
+    @classmethod
+    def from_config(cls) -> Optional['DeltaTracker']:
+        settings = config.CONFIG.get('delta', {})
+        if not settings.get('enabled'):
+            return None
+        return cls(settings.get('path', 'fingerprints.sqlite'), settings.get('recheck_competitors', True))
+
+    def status(self, product_id: str, product: Dict[str, str], combined: Optional[Dict] = None) -> str:
+        """new, changed или unchanged; без combined описания конкурентов не сравниваются"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT source, competitors FROM fingerprints WHERE product_id = ?', (product_id,)
+            ).fetchone()
+        if row is None:
+            return 'new'
+        if row[0] != fingerprint(product, SOURCE_FIELDS):
+            return 'changed'
+        if combined is not None and row[1] != fingerprint(combined):
+            return 'changed'
+        return 'unchanged'
+
+    def skip(self, product_id: str):
+        with self._lock:
+            self.counts['skipped'] += 1
+
+    def stage(self, product_id: str, product: Dict[str, str], combined: Dict, status: str):
+        # Отпечаток сохраняется только после выгрузки строки, иначе упавший прогон пропустил бы товар навсегда
+        with self._lock:
+            self.counts[status] += 1
+            self._pending[product_id] = (fingerprint(product, SOURCE_FIELDS), fingerprint(combined))
+
+    def commit(self, product_id: str):
+        with self._lock:
+            fingerprints = self._pending.pop(product_id, None)
+            if fingerprints is None:
+                return
+            with self._conn:
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?)', (product_id, *fingerprints, time.time())
+                )
+
+    def discard(self, product_id: str):
+        # Генерация не удалась: без отпечатка следующий прогон обработает товар заново
+        with self._lock:
+            self._pending.pop(product_id, None)
+
+    def report(self) -> Dict[str, int]:
+        with self._lock:
+            return {status: self.counts.get(status, 0) for status in ('skipped', 'changed', 'new')}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -6,6 +6,66 @@ import re
 from typing import Dict
 
 
+# Замены символов, которые модель путает: тире, кавычки, знаки, надстрочные цифры
+CHARACTER_TABLE = str.maketrans({
+    **dict.fromkeys('\u2010\u2011\u2012\u2013\u2014\u2015\u2212', '-'),
+    **dict.fromkeys('\u201c\u201e\u2018\u201a\u2039', '«'),
+    **dict.fromkeys('\u201d\u201f\u2019\u201b\u203a', '»'),
+    **dict.fromkeys('®™©℗℠°\u00ad\u200b\u200c\u200d\ufeff', None),
+    '\u00a0': ' ', '\u202f': ' ', '\u2009': ' ',
+    '×': '*',
+    '±': ' около ', '≥': ' больше или равно ', '≤': ' меньше или равно ',
+    '⁰': '0', '¹': '1', '²': '2', '³': '3', '⁴': '4', '⁵': '5', '⁶': '6', '⁷': '7', '⁸': '8', '⁹': '9',
+})
+SPECIAL_CHARS_RE = re.compile('[' + re.escape(''.join(map(chr, CHARACTER_TABLE))) + ']+')
+# Правила начинаются с самого символа, чтобы re не проверял каждую позицию текста
+APOSTROPHE_RE = re.compile(r"[\u2019'](?<=\w[\u2019'])(?=\w)")
+# Прямые кавычки заменяются только парами: одиночная " - это дюймы (5" дюймов), а внутри тегов - атрибуты
+QUOTE_PAIR_RE = re.compile(r'"(?<![^\s(\[«]")(?=[^\s"])([^"\n]*?)(?<=[^\s"])"(?!\w)')
+HTML_TAG_RE = re.compile(r'(<[^<>]*>)')
+DEGREE_UNIT_RE = re.compile(r'°[ \t]*(?=[CСFФ]\b)')
+SPACES_RE = re.compile(r'[ \t][ \t]+')
+LINE_START_SPACES_RE = re.compile(r'^[ \t]+', re.MULTILINE)
+
+
+def pair_quotes(text: str) -> str:
+    parts = HTML_TAG_RE.split(text)
+    # Нечётные части - сами теги, их не трогаем
+    for position in range(0, len(parts), 2):
+        if '"' in parts[position]:
+            parts[position] = QUOTE_PAIR_RE.sub(r'«\1»', parts[position])
+    return ''.join(parts)
+
+
+class TextNormalizer:
+    """Детерминированно заменяет запрещённые символы в текстах конкурентов и ответах модели"""
+
+    def __init__(self, table: Dict[int, str] = CHARACTER_TABLE):
+        self.table = table
+
+    def normalize(self, text: str) -> str:
+        if not text:
+            return text
+        # Апостроф внутри слова (L’Oreal) - не кавычка
+        if '\u2019' in text or "'" in text:
+            text = APOSTROPHE_RE.sub('\u02bc', text)
+        if '"' in text:
+            text = pair_quotes(text)
+        # 30°С -> 30 С, остальные градусы просто удаляются таблицей
+        if '°' in text:
+            text = DEGREE_UNIT_RE.sub(' ', text)
+        # Для кириллицы str.translate идёт медленным путём по каждому символу - переводим только найденные участки
+        text = SPECIAL_CHARS_RE.sub(self._translate, text).replace('\u02bc', "'")
+        text = SPACES_RE.sub(' ', text)
+        return LINE_START_SPACES_RE.sub('', text)
+
+    def _translate(self, match: re.Match) -> str:
+        return match.group().translate(self.table)
+
+    def normalize_fields(self, fields: Dict[str, str]) -> Dict[str, str]:
+        return {key: self.normalize(value) if isinstance(value, str) else value for key, value in fields.items()}
+
+
 class DentalFirstFormatter:
     def __init__(self):
         self.rules = {
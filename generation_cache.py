@@ -0,0 +1,109 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+import config
+from metrics import METRICS
+
+
+class GenerationCache:
+    """Постоянный кэш сгенерированных описаний с вытеснением давно не использованных записей по размеру"""
+
+    def __init__(self, path: str, max_bytes: int = 200 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS generations ('
+            'key TEXT PRIMARY KEY, value TEXT, size INTEGER, created_at REAL, last_access REAL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS generations_last_access ON generations (last_access)')
+        # Число записей и общий размер хранятся отдельной строкой: без пересчёта SUM(size) по всей таблице на каждую запись
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS generations_total (id INTEGER PRIMARY KEY CHECK (id = 0), entries INTEGER, size INTEGER)'
+        )
+        self._conn.execute(
+            'INSERT OR IGNORE INTO generations_total SELECT 0, COUNT(*), COALESCE(SUM(size), 0) FROM generations'
+        )
+        self._conn.commit()
+
+    @classmethod
+    def from_config(cls) -> Optional['GenerationCache']:
+        settings = config.CONFIG.get('generation_cache', {})
+        if not settings.get('enabled'):
+            return None
+        return cls(settings.get('path', 'generation_cache.sqlite'), settings.get('max_bytes', 200 * 1024 * 1024))
+
+    @staticmethod
+    def make_key(model: str, system_message: str, prompt: str, source: str) -> str:
+        payload = json.dumps([model, system_message, prompt, source], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, str]]:
+        with self._lock:
+            row = self._conn.execute('SELECT value FROM generations WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                METRICS.increment('generation_cache_total', outcome='misses')
+                return None
+            self.hits += 1
+            METRICS.increment('generation_cache_total', outcome='hits')
+            self._conn.execute('UPDATE generations SET last_access = ? WHERE key = ?', (time.time(), key))
+            self._conn.commit()
+        return json.loads(row[0])
+
+    def put(self, key: str, value: Dict[str, str]):
+        data = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        size = len(data.encode('utf-8'))
+        with self._lock:
+            with self._conn:
+                old = self._conn.execute('SELECT size FROM generations WHERE key = ?', (key,)).fetchone()
+                self._conn.execute('INSERT OR REPLACE INTO generations VALUES (?, ?, ?, ?, ?)', (key, data, size, now, now))
+                self._conn.execute(
+                    'UPDATE generations_total SET entries = entries + ?, size = size + ? WHERE id = 0',
+                    (0 if old else 1, size - (old[0] if old else 0))
+                )
+                total = self._conn.execute('SELECT size FROM generations_total WHERE id = 0').fetchone()[0]
+                if total > self.max_bytes:
+                    self._evict(total)
+
+    def _evict(self, total: int):
+        # Удаляем самые давно использованные записи, пока не уложимся в лимит
+        while total > self.max_bytes:
+            rows = self._conn.execute('SELECT key, size FROM generations ORDER BY last_access LIMIT 100').fetchall()
+            if not rows:
+                break
+            evicted = []
+            for key, size in rows:
+                evicted.append((key,))
+                total -= size
+                if total <= self.max_bytes:
+                    break
+            self._conn.executemany('DELETE FROM generations WHERE key = ?', evicted)
+            self._conn.execute(
+                'UPDATE generations_total SET entries = entries - ?, size = size - ? WHERE id = 0',
+                (len(evicted), sum(size for _, size in rows[:len(evicted)]))
+            )
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            entries, size = self._conn.execute('SELECT entries, size FROM generations_total WHERE id = 0').fetchone()
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'entries': entries,
+            'bytes': size,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
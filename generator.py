@@ -1,20 +1,227 @@
+import json
+import random
 import re
+import threading
+import time
 import uuid
-from typing import List, Dict
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, List, Dict, Optional, Iterable, Iterator
 
 import requests
+import config
+from dedup import SentenceDeduplicator
+from formatter import TextNormalizer
+from generation_cache import GenerationCache
+from metrics import METRICS
+from transport import HttpTransport
 
+DEFAULT_TOKEN_TTL = 30 * 60  # Токен GigaChat живёт 30 минут, если срок не пришёл в ответе
 
-class DescriptionGenerator:
-    def __init__(self, secret_key: str):
-        self.authorization_key = secret_key
-        self.token = None
-        self.prompt_template = """
-        На основе следующего описания товара из стоматологической сферы создай новое, уникальное и SEO-оптимизированное описание:
 
-        {original_description}
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+SOURCE_FIELDS = ('meta_title', 'meta_description', 'h2', 'top_description', 'basic_description')
+# Разделы ответа модели: короткие поля занимают одну строку, Text - весь остаток
+SECTIONS = (('title', 'Title'), ('meta_description', 'Description'), ('keywords', 'Keywords'))
+RESULT_FIELDS = ('title', 'meta_description', 'keywords', 'text')
+STREAM_CHUNK_SIZE = 128  # Байт за одно чтение потока: меньше - раньше видны первые поля
+
+
+def source_text(combined: Dict[str, str]) -> str:
+    """Текст для промпта из объединённых описаний конкурентов (результат CompetitorScraper.search_product)"""
+    return '\n'.join(combined[field] for field in SOURCE_FIELDS if combined.get(field))
+
+
+def parse_generated_text(text: str) -> Dict[str, str]:
+    result = {
+        'title': '',
+        'meta_description': '',
+        'keywords': '',
+        'text': ''
+    }
+    title_match = re.search(r'Title:\s*(.+)', text)
+    if title_match:
+        result['title'] = title_match.group(1).strip()
+
+    desc_match = re.search(r'Description:\s*(.+)', text)
+    if desc_match:
+        result['meta_description'] = desc_match.group(1).strip()
+
+    keywords_match = re.search(r'Keywords:\s*(.+)', text)
+    if keywords_match:
+        result['keywords'] = keywords_match.group(1).strip()
+
+    text_match = re.search(r'Text:\s*(.+)', text, re.DOTALL)
+    if text_match:
+        result['text'] = text_match.group(1).strip()
+
+    return result
+
+
+def parse_packed_response(content: str, count: int) -> Dict[int, Dict[str, str]]:
+    """Разбирает JSON-ответ на пакет из count товаров: {номер товара: поля}, неполные объекты пропускаются"""
+    start, end = content.find('['), content.rfind(']')
+    if start == -1 or end < start:
+        raise MalformedCompletionError("packed response has no JSON array")
+    try:
+        items = json.loads(content[start:end + 1])
+    except ValueError as e:
+        raise MalformedCompletionError(f"packed response is not valid JSON: {e}")
+
+    results = {}
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict):
+            continue
+        position = item.get('id')
+        if isinstance(position, str) and position.strip().isdigit():
+            position = int(position)
+        if not isinstance(position, int) or not 1 <= position <= count or position in results:
+            continue
+        result = {field: item.get(field) or '' for field in RESULT_FIELDS}
+        if not all(isinstance(value, str) for value in result.values()):
+            continue
+        result = {field: value.strip() for field, value in result.items()}
+        if result['title'] and result['text']:
+            results[position] = result
+    return results
+
+
+class MalformedCompletionError(ValueError):
+    """Ответ модели не похож на формат Title/Description/Keywords/Text - генерацию прерываем"""
+
+
+class CompletionStreamParser:
+    """Разбирает ответ модели по частям: короткие поля отдаются в on_field, как только их строка завершена"""
+
+    def __init__(self, on_field: Optional[Callable[[str, str], None]] = None,
+                 abort_after_chars: int = 300, max_field_chars: int = 500,
+                 normalize: Optional[Callable[[str], str]] = None):
+        self.on_field = on_field
+        self.normalize = normalize
+        self.abort_after_chars = abort_after_chars
+        self.max_field_chars = max_field_chars
+        self.text = ''
+        self.fields = {}
+        self._patterns = [(field, re.compile(rf'{header}:[ \t]*(.+)\n'), f'{header}:') for field, header in SECTIONS]
+
+    def feed(self, chunk: str):
+        self.text += chunk
+        if 'title' not in self.fields and 'Title:' not in self.text and len(self.text) > self.abort_after_chars:
+            raise MalformedCompletionError(f"no Title: in the first {len(self.text)} chars")
+        for field, pattern, header in self._patterns:
+            if field in self.fields:
+                continue
+            match = pattern.search(self.text)
+            if match:
+                self._emit(field, match.group(1).strip())
+                continue
+            # Заголовок есть, а строка всё не кончается - модель пишет не то, что просили
+            position = self.text.find(header)
+            if position != -1 and len(self.text) - position > self.max_field_chars:
+                raise MalformedCompletionError(f"{header} line is longer than {self.max_field_chars} chars")
+
+    def finish(self) -> Dict[str, str]:
+        result = parse_generated_text(self.text)
+        if not (result['title'] or result['text']):
+            raise MalformedCompletionError("completion has neither Title: nor Text:")
+        if self.normalize:
+            result = {field: self.normalize(value) for field, value in result.items()}
+        for field, value in result.items():
+            if field not in self.fields and value:
+                self._emit(field, value)
+        return result
+
+    def _emit(self, field: str, value: str):
+        if self.normalize:
+            value = self.normalize(value)
+        self.fields[field] = value
+        if self.on_field:
+            self.on_field(field, value)
+
+
+@dataclass
+class GenerationResult:
+    index: int
+    result: Optional[Dict[str, str]] = None
+    error: Optional[str] = None
+
+
+class GigaChatTokenManager:
+    """OAuth-токен GigaChat: обновляется незадолго до истечения, одним запросом на все потоки"""
 
-        Требования к новому описанию:
+    def __init__(self, authorization_key: str, session: requests.Session, oauth_url: str,
+                 scope: str = 'GIGACHAT_API_PERS', refresh_margin: float = 60):
+        self.authorization_key = authorization_key
+        self.session = session
+        self.oauth_url = oauth_url
+        self.scope = scope
+        self.refresh_margin = refresh_margin
+        self._token = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def get_token(self) -> str:
+        # Пока один поток обновляет токен, остальные ждут на блокировке и получают уже новый
+        with self._lock:
+            if self._token is None or time.time() >= self._expires_at - self.refresh_margin:
+                self._refresh()
+            return self._token
+
+    def invalidate(self, token: str):
+        with self._lock:
+            if self._token == token:
+                self._token = None
+
+    def _refresh(self):
+        headers = {
+            'Content-Type': 'application/x-www-form-urlencoded',
+            'Accept': 'application/json',
+            'RqUID': str(uuid.uuid4()),
+            'Authorization': f'Basic {self.authorization_key}'
+        }
+        payload = {'scope': self.scope}
+        response = self.session.request("POST", self.oauth_url, headers=headers, data=payload)
+        response.raise_for_status()
+        data = response.json()
+        self._token = data['access_token']
+        expires_at = data.get('expires_at')
+        if expires_at:
+            # GigaChat отдаёт время истечения в миллисекундах
+            self._expires_at = expires_at / 1000 if expires_at > 1e11 else float(expires_at)
+        else:
+            self._expires_at = time.time() + DEFAULT_TOKEN_TTL
+
+
+class DescriptionGenerator:
+    def __init__(self, secret_key: str, transport: Optional[HttpTransport] = None,
+                 cache: Optional[GenerationCache] = None, deduplicator: Optional[SentenceDeduplicator] = None):
+        self.authorization_key = secret_key
+        self.cache = cache
+        self.deduplicator = deduplicator
+        # Тире, кавычки, ®, ², °, ×, ± и т.п. заменяются кодом, а не инструкцией в промпте
+        self.normalizer = TextNormalizer() if config.CONFIG.get('normalize_text', True) else None
+        self.force_regenerate = config.CONFIG.get('generation_cache', {}).get('force', False)
+        self.system_message = "Ты профессиональный копирайтер для стоматологического e-commerce."
+        self.transport = transport or HttpTransport()
+        # 429 и 5xx повторяет _with_retry с учётом Retry-After, адаптер транспорта их не повторяет
+        self.session = self.transport.session(retry_throttled=False)
+        self.api_url = config.CONFIG.get('gigachat_api_url', "https://gigachat.devices.sberbank.ru/api/v1/completions")
+        self.model = config.CONFIG.get('gigachat_model', "GigaChat")  # или "GigaChat-Pro", если доступно
+        self.max_in_flight = config.CONFIG.get('generation_concurrency', 4)
+        self.retries = config.CONFIG.get('generation_retries', 3)
+        self.backoff = config.CONFIG.get('generation_backoff', 2.0)
+        self.stream_settings = config.CONFIG.get('generation_stream', {})
+        self.stream = self.stream_settings.get('enabled', False)
+        self.token_manager = GigaChatTokenManager(
+            secret_key,
+            self.session,
+            config.CONFIG.get('gigachat_oauth_url', "https://ngw.devices.sberbank.ru:9443/api/v2/oauth"),
+            config.CONFIG.get('gigachat_scope', 'GIGACHAT_API_PERS'),
+        )
+        self.pack_settings = config.CONFIG.get('generation_pack', {})
+        self.pack_size = self.pack_settings.get('max_products', 5) if self.pack_settings.get('enabled') else 1
+        self.requirements = """Требования к новому описанию:
         1. Сохранить все ключевые характеристики и преимущества
         2. Использовать профессиональную терминологию
         3. Оптимизировать для SEO (естественное включение ключевых слов)
@@ -22,15 +229,6 @@ class DescriptionGenerator:
         5. Структурированный текст с абзацами
         6. Уникальность не менее 85%
 
-        Запрещенные символы
-        1. Любые тире меняем на дефис - ‘ ‘ и “ ” меняем на « »
-        2. Значки типо ®, ™ и тд. - удаляем
-        3. Значок мат.степени - удаляем (25 мм² -> 25 мм2)
-        3. Значок градуса ° либо убираем (30° С -> 30 С) либо пишем текстом (угол 30 градусов)
-        4. Знак умножения “×” меняем на “*”
-        5. Знак “±” удаляем или меняем на “около”
-        6. Знаки “≥” и “≤” удаляем или меняем на “больше или равно”
-
         Структура:
         1. заголовок: «Название товара - слоган» (не длиннее одной строки).
         3. Дескрипшен: «Товар от производителя, указать бренд - это ...».
@@ -41,83 +239,318 @@ class DescriptionGenerator:
         - Title (до 60 символов)
         - Meta Description (до 160 символов)
         - Keywords (5-7 ключевых слов/фраз)
+"""
+        self.prompt_template = """
+        На основе следующего описания товара из стоматологической сферы создай новое, уникальное и SEO-оптимизированное описание:
 
+        {original_description}
+
+        """ + self.requirements + """
         Верни ответ в формате:
         Title: ...
         Description: ...
         Keywords: ...
         Text: ...
         """
+        # Общая инструкция один раз на несколько коротких товаров, ответ - JSON по товару
+        self.pack_template = """
+        Ниже несколько товаров из стоматологической сферы, у каждого свой номер. Для каждого создай новое, уникальное и SEO-оптимизированное описание:
+
+        {products}
+
+        """ + self.requirements + """
+        Верни ответ строго в виде JSON-массива без пояснений, по одному объекту на каждый товар:
+        [{{"id": номер товара, "title": "...", "meta_description": "...", "keywords": "...", "text": "..."}}]
+        """
+
+    def _post_completion(self, json_data: Dict, stream: bool = False) -> requests.Response:
+        token = self.token_manager.get_token()
+        response = self._send_completion(token, json_data, stream)
+        if response.status_code == 401:
+            # Токен отозван или истёк раньше срока - получаем новый и повторяем один раз
+            response.close()
+            self.token_manager.invalidate(token)
+            response = self._send_completion(self.token_manager.get_token(), json_data, stream)
+        return response
 
-    def _get_oauth_token(self) -> str:
-        url = "https://ngw.devices.sberbank.ru:9443/api/v2/oauth"
+    def _send_completion(self, token: str, json_data: Dict, stream: bool = False) -> requests.Response:
         headers = {
-            'Content-Type': 'application/x-www-form-urlencoded',
-            'Accept': 'application/json',
-            'RqUID': str(uuid.uuid4()),
-            'Authorization': f'Basic {self.authorization_key}'
+            'Authorization': f'Bearer {token}',
+            'Accept': 'text/event-stream' if stream else 'application/json',
+            'RqUID': str(uuid.uuid4())
         }
-        payload = {'scope': 'GIGACHAT_API_PERS'}
-        response = requests.request("POST", url, headers=headers, data=payload)
-        response.raise_for_status()
-        return response.json().get('access_token')
-
-    def _ensure_token(self):
-        if not self.token:
-            self.token = self._get_oauth_token()
+        return self.session.post(self.api_url, headers=headers, json=json_data, stream=stream,
+                                 verify=False)  # Для продакшена укажите verify с сертификатом
 
-    def generate_description(self, original_description: str) -> Dict[str, str] or None:
+    def generate_description(self, original_description: str | Dict[str, str], force: bool = False,
+                             on_field: Optional[Callable[[str, str], None]] = None) -> Dict[str, str] or None:
+        """on_field(field, value) вызывается для каждого готового поля; в потоковом режиме - до конца ответа"""
         try:
-            self._ensure_token()
-            api_url = "https://gigachat.devices.sberbank.ru/api/v1/completions"
-            headers = {
-                'Authorization': f'Bearer {self.token}',
-                'Accept': 'application/json',
-                'RqUID': str(uuid.uuid4())
-            }
-            json_data = {
-                "model": "GigaChat",  # или "gigachat-pro", если доступно
-                "messages": [
-                    {"role": "system", "content": "Ты профессиональный копирайтер для стоматологического e-commerce."},
-                    {"role": "user", "content": self.prompt_template.format(original_description=original_description)}
-                ]
-            }
-            response = requests.post(api_url, headers=headers, json=json_data, verify=False)  # Для продакшена укажите verify с сертификатом
-            response.raise_for_status()
-            generated_text = response.json()['choices'][0]['message']['content']
-            return self._parse_generated_text(generated_text)
+            return self._cached_generate(original_description, force, on_field)
         except Exception as e:
             print(f"Error generating description: {e}")
             return None
 
-    def _parse_generated_text(self, text: str) -> Dict[str, str]:
-        result = {
-            'title': '',
-            'meta_description': '',
-            'keywords': '',
-            'text': ''
-        }
-        title_match = re.search(r'Title:\s*(.+)', text)
-        if title_match:
-            result['title'] = title_match.group(1).strip()
+    def _cached_generate(self, original_description: str | Dict[str, str], force: bool = False,
+                         on_field: Optional[Callable[[str, str], None]] = None) -> Dict[str, str]:
+        original_description = self._prepare_source(original_description)
+        key = self._cache_key(original_description)
+        cached = self._cache_lookup(key, force)
+        if cached is not None:
+            if on_field:
+                for field, value in cached.items():
+                    if value:
+                        on_field(field, value)
+            return cached
+        result = self._generate_with_retry(original_description, on_field)
+        self._cache_store(key, result)
+        return result
 
-        desc_match = re.search(r'Description:\s*(.+)', text)
-        if desc_match:
-            result['meta_description'] = desc_match.group(1).strip()
+    def _prepare_source(self, original_description: str | Dict[str, str]) -> str:
+        if self.normalizer:
+            if isinstance(original_description, dict):
+                original_description = self.normalizer.normalize_fields(original_description)
+            else:
+                original_description = self.normalizer.normalize(original_description)
+        if self.deduplicator:
+            original_description = self._deduplicate(original_description)
+        if isinstance(original_description, dict):
+            original_description = source_text(original_description)
+        return original_description
 
-        keywords_match = re.search(r'Keywords:\s*(.+)', text)
-        if keywords_match:
-            result['keywords'] = keywords_match.group(1).strip()
+    def _cache_key(self, original_description: str) -> Optional[str]:
+        if self.cache is None:
+            return None
+        # Ключ не зависит от пробелов и переносов во входном тексте
+        normalized = ' '.join(original_description.split())
+        return self.cache.make_key(self.model, self.system_message, self._render_prompt(normalized), normalized)
 
-        text_match = re.search(r'Text:\s*(.+)', text, re.DOTALL)
-        if text_match:
-            result['text'] = text_match.group(1).strip()
+    def _cache_lookup(self, key: Optional[str], force: bool = False) -> Optional[Dict[str, str]]:
+        if key is None or force or self.force_regenerate:
+            return None
+        return self.cache.get(key)
 
+    def _cache_store(self, key: Optional[str], result: Dict[str, str]):
+        if key is not None and (result.get('title') or result.get('text')):
+            self.cache.put(key, result)
+
+    def _deduplicate(self, original_description: str | Dict[str, str]) -> str | Dict[str, str]:
+        # Конкуренты часто копируют текст производителя - повторы только раздувают промпт
+        if isinstance(original_description, dict):
+            deduplicated, stats = self.deduplicator.deduplicate(original_description)
+        else:
+            deduplicated, stats = self.deduplicator.deduplicate({'basic_description': original_description})
+            deduplicated = deduplicated['basic_description']
+        if stats.get('duplicates_removed') or stats.get('truncated_sentences'):
+            print(f"Prompt input reduced from {stats['chars_before']} to {stats['chars_after']} chars "
+                  f"({stats.get('duplicates_removed', 0)} duplicate, {stats.get('truncated_sentences', 0)} over-budget sentences)")
+        return deduplicated
+
+    def _render_prompt(self, original_description: str) -> str:
+        return self.prompt_template.format(original_description=original_description)
+
+    def _generate(self, original_description: str,
+                  on_field: Optional[Callable[[str, str], None]] = None) -> Dict[str, str]:
+        json_data = {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": self.system_message},
+                {"role": "user", "content": self._render_prompt(original_description)}
+            ]
+        }
+        if self.stream:
+            return self._generate_streaming(json_data, on_field)
+        response = self._post_completion(json_data)
+        response.raise_for_status()
+        body = response.json()
+        self._record_usage(body)
+        generated_text = body['choices'][0]['message']['content']
+        result = self._parse_generated_text(generated_text)
+        if self.normalizer:
+            result = self.normalizer.normalize_fields(result)
+        if on_field:
+            for field, value in result.items():
+                if value:
+                    on_field(field, value)
         return result
 
-    def batch_generate(self, descriptions: List[str]) -> List[Dict[str, str]]:
-        return [self.generate_description(desc) for desc in descriptions]
+    def _generate_streaming(self, json_data: Dict,
+                            on_field: Optional[Callable[[str, str], None]] = None) -> Dict[str, str]:
+        parser = CompletionStreamParser(
+            on_field,
+            self.stream_settings.get('abort_after_chars', 300),
+            self.stream_settings.get('max_field_chars', 500),
+            self.normalizer.normalize if self.normalizer else None,
+        )
+        response = self._post_completion(dict(json_data, stream=True), stream=True)
+        # Закрытие соединения посреди ответа останавливает генерацию - за испорченный ответ не платим целиком
+        with response:
+            response.raise_for_status()
+            response.encoding = 'utf-8'  # Для text/event-stream без charset requests выбрал бы latin-1
+            for line in response.iter_lines(chunk_size=STREAM_CHUNK_SIZE, decode_unicode=True):
+                if not line.startswith('data:'):
+                    continue
+                data = line[5:].strip()
+                if data == '[DONE]':
+                    break
+                choices = json.loads(data).get('choices') or [{}]
+                content = choices[0].get('delta', {}).get('content')
+                if content:
+                    parser.feed(content)
+        return parser.finish()
+
+    def _generate_packed(self, descriptions: List[str]) -> Dict[int, Dict[str, str]]:
+        products = '\n\n'.join(f"Товар {position}:\n{text}" for position, text in enumerate(descriptions, 1))
+        json_data = {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": self.system_message},
+                {"role": "user", "content": self.pack_template.format(products=products)}
+            ]
+        }
+        response = self._post_completion(json_data)
+        response.raise_for_status()
+        body = response.json()
+        self._record_usage(body)
+        results = parse_packed_response(body['choices'][0]['message']['content'], len(descriptions))
+        if self.normalizer:
+            results = {position: self.normalizer.normalize_fields(result) for position, result in results.items()}
+        if len(results) < len(descriptions):
+            print(f"Packed response: {len(descriptions) - len(results)} of {len(descriptions)} products "
+                  f"invalid, generating them one by one")
+        return results
+
+    def _generate_with_retry(self, original_description: str,
+                             on_field: Optional[Callable[[str, str], None]] = None) -> Dict[str, str]:
+        return self._with_retry(self._generate, original_description, on_field)
+
+    @staticmethod
+    def _record_usage(body: Dict):
+        for kind in ('prompt_tokens', 'completion_tokens'):
+            METRICS.increment('llm_tokens_total', (body.get('usage') or {}).get(kind, 0), kind=kind)
+
+    def _with_retry(self, request: Callable, *args):
+        # request - _generate или _generate_packed; время каждой попытки, включая чтение потокового ответа
+        kind = 'packed' if request == self._generate_packed else 'stream' if self.stream else 'single'
+        for attempt in range(self.retries + 1):
+            try:
+                with METRICS.timer('llm_request_seconds', kind=kind):
+                    return request(*args)
+            except requests.HTTPError as e:
+                status = e.response.status_code if e.response is not None else None
+                METRICS.increment('llm_errors_total', error=str(status))
+                if status not in RETRY_STATUSES or attempt == self.retries:
+                    raise
+                # GigaChat ограничивает частоту запросов - ждём Retry-After или экспоненциально растущую паузу
+                retry_after = e.response.headers.get('Retry-After', '')
+                delay = float(retry_after) if retry_after.isdigit() else self.backoff * 2 ** attempt
+                print(f"GigaChat returned {status}, retrying in {delay:.1f}s")
+                time.sleep(delay + random.uniform(0, self.backoff))
+            except Exception as e:
+                METRICS.increment('llm_errors_total', error=type(e).__name__)
+                raise
+
+    def _parse_generated_text(self, text: str) -> Dict[str, str]:
+        return parse_generated_text(text)
+
+    def batch_generate(self, descriptions: List[str | Dict[str, str]],
+                       max_in_flight: Optional[int] = None) -> List[GenerationResult]:
+        results = list(self.iter_generate(descriptions, max_in_flight))
+        for item in results:
+            if item.error:
+                print(f"Failed to generate description #{item.index}: {item.error}")
+        return results
+
+    def iter_generate(self, descriptions: Iterable[str | Dict[str, str]],
+                      max_in_flight: Optional[int] = None) -> Iterator[GenerationResult]:
+        """Генерирует описания параллельно (не больше max_in_flight запросов), результаты - в порядке входа.
 
+        descriptions может быть генератором: элементы забираются по мере поступления, например от сборщика.
+        """
+        max_in_flight = max_in_flight or self.max_in_flight
+        if self.pack_size > 1:
+            yield from self._iter_packed(descriptions, max_in_flight)
+            return
+        with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            pending = deque()
+            for index, description in enumerate(descriptions):
+                pending.append((index, executor.submit(self._cached_generate, description)))
+                # Окно вдвое больше числа потоков, чтобы очередь запросов не простаивала
+                while pending and (len(pending) >= 2 * max_in_flight or pending[0][1].done()):
+                    yield self._collect(*pending.popleft())
+            while pending:
+                yield self._collect(*pending.popleft())
+
+    def generate_batch(self, descriptions: List[str | Dict[str, str]]) -> List[GenerationResult]:
+        """Генерирует небольшую группу описаний в текущем потоке (в пакетном режиме - одним запросом)"""
+        return self._generate_pack(list(enumerate(descriptions)))
+
+    def _iter_packed(self, descriptions: Iterable[str | Dict[str, str]],
+                     max_in_flight: int) -> Iterator[GenerationResult]:
+        with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            pending = deque()
+            pack = []
+            for index, description in enumerate(descriptions):
+                pack.append((index, description))
+                if len(pack) < self.pack_size:
+                    continue
+                pending.append(executor.submit(self._generate_pack, pack))
+                pack = []
+                while pending and (len(pending) >= 2 * max_in_flight or pending[0].done()):
+                    yield from pending.popleft().result()
+            if pack:
+                pending.append(executor.submit(self._generate_pack, pack))
+            while pending:
+                yield from pending.popleft().result()
+
+    def _generate_pack(self, pack: List[tuple]) -> List[GenerationResult]:
+        """Короткие товары пакета - одним запросом; длинные и неудачно разобранные - по отдельности"""
+        results = {}
+        packable = []
+        max_chars = self.pack_settings.get('max_source_chars', 1500)
+        for index, description in pack:
+            try:
+                text = self._prepare_source(description)
+                key = self._cache_key(text)
+                cached = self._cache_lookup(key)
+            except Exception as e:
+                results[index] = GenerationResult(index, error=str(e))
+                continue
+            if cached is not None:
+                results[index] = GenerationResult(index, result=cached)
+            elif len(text) > max_chars:
+                results[index] = self._generate_single(index, text, key)
+            else:
+                packable.append((index, text, key))
+
+        generated = {}
+        if len(packable) > 1:
+            try:
+                generated = self._with_retry(self._generate_packed, [text for _, text, _ in packable])
+            except Exception as e:
+                print(f"Packed generation of {len(packable)} products failed, generating them one by one: {e}")
+        for position, (index, text, key) in enumerate(packable, 1):
+            if position in generated:
+                self._cache_store(key, generated[position])
+                results[index] = GenerationResult(index, result=generated[position])
+            else:
+                results[index] = self._generate_single(index, text, key)
+        return [results[index] for index, _ in pack]
+
+    def _generate_single(self, index: int, text: str, key: Optional[str]) -> GenerationResult:
+        try:
+            result = self._generate_with_retry(text)
+        except Exception as e:
+            return GenerationResult(index, error=str(e))
+        self._cache_store(key, result)
+        return GenerationResult(index, result=result)
+
+    @staticmethod
+    def _collect(index: int, future: Future) -> GenerationResult:
+        try:
+            return GenerationResult(index, result=future.result())
+        except Exception as e:
+            return GenerationResult(index, error=str(e))
 
 if __name__ == "__main__":
 
@@ -1,25 +1,73 @@
-from typing import List, Dict
+import random
+import threading
+import time
+from typing import Callable, List, Dict, Optional
 import gspread
+from gspread.utils import rowcol_to_a1
 from google.oauth2.service_account import Credentials
+import config
+from metrics import METRICS
+
+QUOTA_STATUSES = (429, 500, 502, 503)
+
+
+def _cell(value) -> str:
+    # Пустое поле (None) в таблице - пустая ячейка, а не строка "None"
+    return '' if value is None else str(value)
 
 
 class GoogleSheetsHandler:
-    def __init__(self, creds_file, spreadsheet_id):
+    def __init__(self, creds_file, spreadsheet_id, client: Optional[gspread.Client] = None):
+        """client - уже готовый клиент gspread (например, поддельный в benchmarks/mock_services.py)"""
         self.scope = ['https://www.googleapis.com/auth/spreadsheets']
-        self.creds = Credentials.from_service_account_file(creds_file, scopes=self.scope)
-        self.client = gspread.authorize(self.creds)
+        if client is None:
+            self.creds = Credentials.from_service_account_file(creds_file, scopes=self.scope)
+            client = gspread.authorize(self.creds)
+        self.client = client
         self.spreadsheet_id = spreadsheet_id
+        self.retries = config.CONFIG.get('sheets', {}).get('retries', 5)
+        self.backoff = config.CONFIG.get('sheets', {}).get('backoff', 2.0)
+        # Таблица и листы открываются один раз: каждое открытие - отдельный запрос к API
+        self._spreadsheet = None
+        self._worksheets = {}
+        # Лист -> {'headers': [...], 'rows': {DF ID: (номер строки, значения)}, 'count': строк на листе}
+        self._row_indexes = {}
+
+    def spreadsheet(self) -> gspread.Spreadsheet:
+        if self._spreadsheet is None:
+            self._spreadsheet = self.call_with_retry(self.client.open_by_key, self.spreadsheet_id)
+        return self._spreadsheet
+
+    def worksheet(self, sheet_name: str) -> gspread.Worksheet:
+        if sheet_name not in self._worksheets:
+            self._worksheets[sheet_name] = self.call_with_retry(self.spreadsheet().worksheet, sheet_name)
+        return self._worksheets[sheet_name]
+
+    def call_with_retry(self, func, *args, **kwargs):
+        for attempt in range(self.retries + 1):
+            try:
+                return func(*args, **kwargs)
+            except gspread.exceptions.APIError as e:
+                status = e.response.status_code if getattr(e, 'response', None) is not None else e.code
+                if status not in QUOTA_STATUSES or attempt == self.retries:
+                    raise
+                # Квота Sheets API считается по минутам - ждём с растущей паузой
+                delay = self.backoff * 2 ** attempt + random.uniform(0, self.backoff)
+                print(f"Google Sheets returned {status}, retrying in {delay:.1f}s")
+                time.sleep(delay)
 
-    def create_sheet(self, sheet_name: str, headers: List[str]):
+    def create_sheet(self, sheet_name: str, headers: List[str], rows: int = 0):
+        """rows - сколько строк данных ожидается; лист создаётся сразу нужного размера"""
         try:
-            spreadsheet = self.client.open_by_key(self.spreadsheet_id)
             try:
-                worksheet = spreadsheet.worksheet(sheet_name)
+                self.worksheet(sheet_name)
                 print(f"Лист '{sheet_name}' уже существует.")
                 return True
             except gspread.exceptions.WorksheetNotFound:
-                worksheet = spreadsheet.add_worksheet(title=sheet_name, rows=100, cols=len(headers))
-                worksheet.append_row(headers)
+                worksheet = self.call_with_retry(self.spreadsheet().add_worksheet, title=sheet_name,
+                                                 rows=rows + 1, cols=len(headers))
+                self.call_with_retry(worksheet.update, values=[headers], range_name='A1')
+                self._worksheets[sheet_name] = worksheet
                 print(f"Лист '{sheet_name}' успешно создан с заголовками.")
                 return True
         except Exception as e:
@@ -32,8 +80,7 @@ class GoogleSheetsHandler:
         headers: список заголовков (именно в том порядке, в каком они в таблице)
         """
         try:
-            spreadsheet = self.client.open_by_key(self.spreadsheet_id)
-            worksheet = spreadsheet.worksheet(sheet_name)
+            worksheet = self.worksheet(sheet_name)
 
             rows = []
             for item in data:
@@ -41,13 +88,170 @@ class GoogleSheetsHandler:
                 row = [item.get(header, '') for header in headers]
                 rows.append(row)
 
-            worksheet.append_rows(rows)
+            self.call_with_retry(worksheet.append_rows, rows)
             print(f"Добавлено {len(rows)} строк.")
             return True
         except Exception as e:
             print(f"Ошибка при добавлении данных: {str(e)}")
             return False
 
+    def _row_index(self, sheet_name: str, headers: List[str], key: str) -> Dict:
+        if sheet_name not in self._row_indexes:
+            # Один запрос на весь лист: и номера строк по ключу, и текущие значения для сравнения
+            values = self.call_with_retry(self.worksheet(sheet_name).get_all_values)
+            sheet_headers = values[0] if values and any(values[0]) else headers
+            key_column = sheet_headers.index(key) if key in sheet_headers else None
+            rows = {}
+            for number, row in enumerate(values[1:], start=2):
+                if key_column is not None and key_column < len(row) and row[key_column]:
+                    rows[row[key_column]] = (number, row)
+            self._row_indexes[sheet_name] = {'headers': sheet_headers, 'rows': rows, 'count': max(len(values), 1)}
+        return self._row_indexes[sheet_name]
+
+    def upsert_data(self, sheet_name: str, data: List[Dict[str, str]], headers: List[str],
+                    key: str = 'DF ID') -> Optional[Dict[str, int]]:
+        """Обновляет строки с уже известным значением key (только изменившиеся ячейки), новые дописывает в конец"""
+        try:
+            worksheet = self.worksheet(sheet_name)
+            index = self._row_index(sheet_name, headers, key)
+            columns = [(column, header) for column, header in enumerate(index['headers']) if header in headers]
+            updates = []
+            updated_rows = {}
+            new_rows = []
+            new_positions = {}  # key -> позиция в new_rows
+            stats = {'updated_rows': 0, 'updated_cells': 0, 'unchanged_rows': 0, 'appended_rows': 0}
+
+            for item in data:
+                item_key = _cell(item.get(key))
+                if not item_key or item_key not in index['rows']:
+                    row = [_cell(item.get(header)) if header in headers else '' for header in index['headers']]
+                    if not item_key:
+                        # Строку без ключа не с чем сопоставить - всегда дописывается
+                        new_rows.append(row)
+                    elif item_key in new_positions:
+                        # Повтор нового товара в той же пачке заменяет предыдущую версию
+                        new_rows[new_positions[item_key]] = row
+                    else:
+                        new_positions[item_key] = len(new_rows)
+                        new_rows.append(row)
+                    continue
+                number, existing = updated_rows.get(item_key) or index['rows'][item_key]
+                existing = list(existing) + [''] * (len(index['headers']) - len(existing))
+                changed = 0
+                for column, header in columns:
+                    value = _cell(item.get(header))
+                    if existing[column] != value:
+                        existing[column] = value
+                        updates.append({'range': rowcol_to_a1(number, column + 1), 'values': [[value]]})
+                        changed += 1
+                updated_rows[item_key] = (number, existing)
+                stats['updated_cells'] += changed
+                stats['updated_rows' if changed else 'unchanged_rows'] += 1
+
+            if updates:
+                self.call_with_retry(worksheet.batch_update, updates)
+            index['rows'].update(updated_rows)
+            if new_rows:
+                self.call_with_retry(worksheet.append_rows, new_rows)
+                for item_key, position in new_positions.items():
+                    index['rows'][item_key] = (index['count'] + position + 1, new_rows[position])
+                index['count'] += len(new_rows)
+                stats['appended_rows'] = len(new_rows)
+            print(f"Обновлено {stats['updated_rows']} строк ({stats['updated_cells']} ячеек), "
+                  f"без изменений {stats['unchanged_rows']}, добавлено {stats['appended_rows']}.")
+            return stats
+        except Exception as e:
+            print(f"Ошибка при обновлении данных: {str(e)}")
+            return None
+
+
+class SheetsWriter:
+    """Копит строки и дописывает их в лист пачками: каждые flush_rows строк или flush_seconds секунд"""
+
+    def __init__(self, handler: GoogleSheetsHandler, sheet_name: str, headers: List[str],
+                 flush_rows: int = 50, flush_seconds: float = 30, mode: str = 'append', key: str = 'DF ID',
+                 on_flush: Optional[Callable[[List[Dict[str, str]]], None]] = None, expected_rows: int = 1000):
+        self.handler = handler
+        # Размер нового листа: всей выгрузки, а не первой пачки, иначе каждая следующая пачка расширяет лист
+        self.expected_rows = expected_rows
+        self.on_flush = on_flush
+        self.mode = mode
+        self.key = key
+        self.stats = {}
+        self.sheet_name = sheet_name
+        self.headers = headers
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.written = 0
+        self._buffer = []
+        self._sheet_ready = False
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        # Строки не должны лежать в памяти дольше flush_seconds, даже если новые не приходят
+        self._timer = threading.Thread(target=self._flush_periodically, daemon=True)
+        self._timer.start()
+
+    @classmethod
+    def from_config(cls, handler: GoogleSheetsHandler, sheet_name: str, headers: List[str]) -> 'SheetsWriter':
+        settings = config.CONFIG.get('sheets', {})
+        return cls(handler, sheet_name, headers, settings.get('flush_rows', 50), settings.get('flush_seconds', 30),
+                   settings.get('mode', 'append'), settings.get('key', 'DF ID'),
+                   expected_rows=settings.get('expected_rows', 1000))
+
+    def add(self, row: Dict[str, str]):
+        with self._lock:
+            self._buffer.append(row)
+            full = len(self._buffer) >= self.flush_rows
+        if full:
+            self.flush()
+
+    def flush(self) -> bool:
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+            self._last_flush = time.monotonic()
+            if not rows:
+                return True
+            if not self._sheet_ready:
+                self._sheet_ready = self.handler.create_sheet(self.sheet_name, self.headers,
+                                                              max(self.expected_rows, len(rows)))
+            if self._sheet_ready and self._write(rows):
+                self.written += len(rows)
+                if self.on_flush:
+                    self.on_flush(rows)
+                return True
+            # Не удалось даже после повторов - строки остаются до следующей выгрузки
+            self._buffer = rows + self._buffer
+            return False
+
+    def _write(self, rows: List[Dict[str, str]]) -> bool:
+        with METRICS.timer('sheets_write_seconds', mode=self.mode):
+            if self.mode != 'upsert':
+                written = self.handler.append_data(self.sheet_name, rows, self.headers)
+            else:
+                written = self._upsert(rows)
+        METRICS.increment('sheets_rows_total' if written else 'sheets_errors_total', len(rows), mode=self.mode)
+        return written
+
+    def _upsert(self, rows: List[Dict[str, str]]) -> bool:
+        stats = self.handler.upsert_data(self.sheet_name, rows, self.headers, self.key)
+        if stats is None:
+            return False
+        for name, value in stats.items():
+            self.stats[name] = self.stats.get(name, 0) + value
+        return True
+
+    def _flush_periodically(self):
+        while not self._stop.wait(min(1.0, self.flush_seconds)):
+            if self._buffer and time.monotonic() - self._last_flush >= self.flush_seconds:
+                self.flush()
+
+    def close(self):
+        self._stop.set()
+        self._timer.join()
+        if not self.flush():
+            print(f"Не удалось записать {len(self._buffer)} строк в лист '{self.sheet_name}'")
+
 
 if __name__ == "__main__":
     # Заголовки в нужном порядке
@@ -0,0 +1,129 @@
+import re
+from typing import Dict, List, Optional, Sequence
+from bs4 import BeautifulSoup, SoupStrainer, Tag
+import config
+
+try:
+    import lxml  # noqa: F401
+    HAS_LXML = True
+except ImportError:
+    HAS_LXML = False
+
+try:
+    from selectolax.lexbor import LexborHTMLParser as SelectolaxParser
+except ImportError:
+    try:
+        from selectolax.parser import HTMLParser as SelectolaxParser
+    except ImportError:
+        SelectolaxParser = None
+
+BACKENDS = ('auto', 'html.parser', 'lxml', 'selectolax')
+SELECTOR_PART_RE = re.compile(r'([.#]?)([\w-]+)|\[([\w-]+)(?:=["\']?([^"\'\]]*)["\']?)?\]')
+
+
+def resolve_backend(name: Optional[str] = None) -> str:
+    name = name or config.CONFIG.get('html_parser', 'auto')
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown HTML parser backend: {name}")
+    if name == 'selectolax' and SelectolaxParser is None:
+        name = 'auto'
+    if name == 'lxml' and not HAS_LXML:
+        name = 'auto'
+    if name == 'auto':
+        return 'lxml' if HAS_LXML else 'html.parser'
+    return name
+
+
+def make_soup(html: str, targets: Optional[Sequence[str]] = None, backend: Optional[str] = None,
+              partial: Optional[bool] = None) -> BeautifulSoup:
+    """Разбирает HTML выбранным движком; targets - простые CSS-селекторы блоков, которые нужно оставить"""
+    backend = resolve_backend(backend)
+    if partial is None:
+        partial = config.CONFIG.get('html_partial', False)
+    targets = targets if partial else None
+
+    if backend == 'selectolax':
+        # selectolax быстро находит нужные блоки, а BeautifulSoup разбирает только их
+        if targets:
+            html = _extract_with_selectolax(html, targets)
+        return BeautifulSoup(html, 'lxml' if HAS_LXML else 'html.parser')
+
+    return BeautifulSoup(html, backend, parse_only=TargetStrainer(targets) if targets else None)
+
+
+def _extract_with_selectolax(html: str, targets: Sequence[str]) -> str:
+    tree = SelectolaxParser(html)
+    selected = set()
+    fragments = []
+    for node in tree.css(', '.join(targets)):
+        # Вложенные совпадения уже входят во внешний блок
+        parent = node.parent
+        while parent is not None and parent.mem_id not in selected:
+            parent = parent.parent
+        selected.add(node.mem_id)
+        if parent is None:
+            fragments.append(node.html)
+    return ''.join(fragments)
+
+
+class TargetStrainer(SoupStrainer):
+    """SoupStrainer, оставляющий только элементы, подходящие под один из простых CSS-селекторов"""
+
+    def __init__(self, targets: Sequence[str]):
+        super().__init__()
+        self.targets = [self._parse_selector(selector) for selector in targets]
+
+    @staticmethod
+    def _parse_selector(selector: str) -> Dict:
+        rule = {'name': None, 'classes': [], 'attrs': {}}
+        for prefix, word, attr, value in SELECTOR_PART_RE.findall(selector):
+            if attr:
+                rule['attrs'][attr] = value or None
+            elif prefix == '.':
+                rule['classes'].append(word)
+            elif prefix == '#':
+                rule['attrs']['id'] = word
+            else:
+                rule['name'] = word
+        return rule
+
+    def matches(self, name: str, attrs: Dict) -> bool:
+        for rule in self.targets:
+            if rule['name'] and rule['name'] != name:
+                continue
+            classes = attrs.get('class') or ''
+            classes = classes.split() if isinstance(classes, str) else list(classes)
+            if any(cls not in classes for cls in rule['classes']):
+                continue
+            if any(attr not in attrs or (value is not None and attrs[attr] != value)
+                   for attr, value in rule['attrs'].items()):
+                continue
+            return True
+        return False
+
+    # bs4 >= 4.13
+    def allow_tag_creation(self, nsprefix, name, attrs) -> bool:
+        return self.matches(name, dict(attrs or {}))
+
+    def allow_string_creation(self, string) -> bool:
+        return False
+
+    # bs4 < 4.13
+    def search_tag(self, markup_name=None, markup_attrs={}):
+        if isinstance(markup_name, Tag):
+            return markup_name if self.matches(markup_name.name, markup_name.attrs) else None
+        return markup_name if self.matches(markup_name, dict(markup_attrs)) else None
+
+    def search(self, markup):
+        if isinstance(markup, Tag):
+            return self.search_tag(markup)
+        return None
+
+
+def available_backends() -> List[str]:
+    backends = ['html.parser']
+    if HAS_LXML:
+        backends.append('lxml')
+    if SelectolaxParser is not None:
+        backends.append('selectolax')
+    return backends
@@ -0,0 +1,170 @@
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+from urllib.parse import urlparse
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+import config
+from metrics import METRICS
+
+# Тело ответа хранится уже распакованным, поэтому заголовки транспорта не сохраняем
+SKIPPED_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding', 'connection', 'keep-alive'}
+
+
+class HttpCache:
+    """Дисковый кэш HTTP-ответов (SQLite) с TTL по доменам и условной перепроверкой"""
+
+    def __init__(self, path: str, default_ttl: float = 86400, ttl_by_domain: Optional[Dict[str, float]] = None):
+        self.path = path
+        self.default_ttl = default_ttl
+        self.ttl_by_domain = ttl_by_domain or {}
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'url TEXT PRIMARY KEY, status INTEGER, headers TEXT, body BLOB, '
+            'etag TEXT, last_modified TEXT, stored_at REAL)'
+        )
+        self._conn.commit()
+
+    @classmethod
+    def from_config(cls) -> Optional['HttpCache']:
+        settings = config.CONFIG.get('http_cache', {})
+        if not settings.get('enabled'):
+            return None
+        return cls(settings.get('path', 'http_cache.sqlite'), settings.get('default_ttl', 86400), settings.get('ttl'))
+
+    def ttl_for(self, url: str) -> float:
+        host = urlparse(url).hostname or ''
+        for domain, ttl in self.ttl_by_domain.items():
+            if host == domain or host.endswith('.' + domain):
+                return ttl
+        return self.default_ttl
+
+    def get(self, url: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT status, headers, body, etag, last_modified, stored_at FROM responses WHERE url = ?', (url,)
+            ).fetchone()
+        if not row:
+            return None
+        status, headers, body, etag, last_modified, stored_at = row
+        return {
+            'url': url,
+            'status': status,
+            'headers': json.loads(headers),
+            'body': body,
+            'etag': etag,
+            'last_modified': last_modified,
+            'stored_at': stored_at,
+        }
+
+    def is_fresh(self, entry: Dict) -> bool:
+        return time.time() - entry['stored_at'] < self.ttl_for(entry['url'])
+
+    def store(self, url: str, response: requests.Response):
+        headers = {k: v for k, v in response.headers.items() if k.lower() not in SKIPPED_HEADERS}
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (url, response.status_code, json.dumps(headers), response.content,
+                 response.headers.get('ETag'), response.headers.get('Last-Modified'), time.time())
+            )
+            self._conn.commit()
+
+    def touch(self, url: str):
+        with self._lock:
+            self._conn.execute('UPDATE responses SET stored_at = ? WHERE url = ?', (time.time(), url))
+            self._conn.commit()
+
+    def record(self, outcome: str):
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+        METRICS.increment('http_cache_total', outcome=outcome)
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.revalidated + self.misses
+        return {
+            'hits': self.hits,
+            'revalidated': self.revalidated,
+            'misses': self.misses,
+            'hit_rate': (self.hits + self.revalidated) / total if total else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class CachedSession(requests.Session):
+    """requests.Session, который отдаёт GET-ответы из HttpCache и перепроверяет их по ETag/Last-Modified"""
+
+    def __init__(self, cache: Optional[HttpCache] = None):
+        super().__init__()
+        self.cache = cache
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        if self.cache is None or request.method != 'GET' or kwargs.get('stream'):
+            return self._send_measured(request, **kwargs)
+
+        entry = self.cache.get(request.url)
+        if entry and self.cache.is_fresh(entry):
+            self.cache.record('hits')
+            return self._build_response(entry, request)
+
+        if entry:
+            if entry['etag']:
+                request.headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                request.headers['If-Modified-Since'] = entry['last_modified']
+
+        response = self._send_measured(request, **kwargs)
+        if response.status_code == 304 and entry:
+            self.cache.record('revalidated')
+            self.cache.touch(request.url)
+            return self._build_response(entry, request)
+
+        self.cache.record('misses')
+        if response.status_code == 200:
+            self.cache.store(request.url, response)
+        return response
+
+    def _send_measured(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        # Время до конца тела ответа; для stream=True - только до заголовков
+        host = urlparse(request.url).netloc
+        started = time.perf_counter()
+        try:
+            response = super().send(request, **kwargs)
+        except Exception as e:
+            METRICS.increment('http_errors_total', host=host, error=type(e).__name__)
+            raise
+        METRICS.observe('http_request_seconds', time.perf_counter() - started, host=host)
+        METRICS.increment('http_requests_total', host=host, status=response.status_code)
+        # Размер на проводе: после распаковки gzip тело в несколько раз больше реально скачанного
+        if kwargs.get('stream'):
+            size = int(response.headers.get('Content-Length') or 0)
+        else:
+            # Тело уже прочитано requests; tell() - число байт, полученных из сокета
+            size = response.raw.tell() if hasattr(response.raw, 'tell') else len(response.content)
+        METRICS.increment('http_response_bytes_total', size, host=host)
+        return response
+
+    @staticmethod
+    def _build_response(entry: Dict, request: requests.PreparedRequest) -> requests.Response:
+        response = requests.Response()
+        response.status_code = entry['status']
+        response.reason = 'OK'
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response._content = entry['body']
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = entry['url']
+        response.request = request
+        response.from_cache = True
+        return response
@@ -0,0 +1,83 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, Optional
+import config
+
+
+class JobState:
+    """Состояние прогона по этапам: (этап, ключ товара) -> done/failed и результат этапа, для продолжения через --resume.
+
+    Ключ этапа parse - ссылка на товар из каталога, остальных этапов - ID товара Dental First.
+    """
+
+    def __init__(self, path: str, job: str):
+        self.path = path
+        self.job = job
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        # Каждая запись - отдельная транзакция, синхронно сброшенная на диск: падение не оставит половину записи
+        self._conn.execute('PRAGMA synchronous=FULL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS job_stages ('
+            'job TEXT, stage TEXT, key TEXT, status TEXT, output TEXT, error TEXT, updated_at REAL, '
+            'PRIMARY KEY (job, stage, key))'
+        )
+        self._conn.commit()
+
+    @classmethod
+    def from_config(cls, job: str, resume: bool = False) -> Optional['JobState']:
+        settings = config.CONFIG.get('job_state', {})
+        if not settings.get('enabled'):
+            return None
+        state = cls(settings.get('path', 'job_state.sqlite'), job)
+        if not resume:
+            state.reset()
+        return state
+
+    def load(self, stage: str, key: str) -> Optional[Dict[str, Any]]:
+        """Возвращает {'output': ...}, если этап для товара завершён; output = None - этап ничего не дал"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT output FROM job_stages WHERE job = ? AND stage = ? AND key = ? AND status = 'done'",
+                (self.job, stage, key)
+            ).fetchone()
+        if not row:
+            return None
+        return {'output': json.loads(row[0]) if row[0] is not None else None}
+
+    def mark_done(self, stage: str, key: str, output: Any = None):
+        self._write(stage, key, 'done', json.dumps(output, ensure_ascii=False) if output is not None else None, None)
+
+    def mark_failed(self, stage: str, key: str, error: str):
+        self._write(stage, key, 'failed', None, error)
+
+    def _write(self, stage: str, key: str, status: str, output: Optional[str], error: Optional[str]):
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO job_stages VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (self.job, stage, key, status, output, error, time.time())
+                )
+
+    def reset(self):
+        with self._lock:
+            with self._conn:
+                self._conn.execute('DELETE FROM job_stages WHERE job = ?', (self.job,))
+
+    def summary(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT stage, status, COUNT(*) FROM job_stages WHERE job = ? GROUP BY stage, status', (self.job,)
+            ).fetchall()
+        summary = defaultdict(dict)
+        for stage, status, count in rows:
+            summary[stage][status] = count
+        return dict(summary)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
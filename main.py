@@ -1,86 +1,417 @@
+import argparse
+import os
+import socket
 import time
+from typing import Dict, Iterator, List, Optional, Tuple
 import config
+from catalog_index import CatalogIndex, CatalogIndexBuilder
 from generator import DescriptionGenerator
-from google_sheets import GoogleSheetsHandler
-from parser import DentalFirstParser
+from dedup import SentenceDeduplicator
+from delta import DeltaTracker
+from generation_cache import GenerationCache
+from google_sheets import GoogleSheetsHandler, SheetsWriter
+from job_state import JobState
+from metrics import MetricsExporter
+from parser import CATEGORY_NAV_SELECTOR, DentalFirstParser
+from pipeline import Pipeline, Stage
 from scraper import CompetitorScraper
+from transport import HttpTransport
+from url_index import ProductUrlIndex
+from work_queue import WorkQueue
 
+SHEET_NAME = 'Product Descriptions'
+HEADERS = [
+    "URL", "DF Номенклатура", "Бренд", "Страна", "DF Артикул",
+    "DF META TITLE", "DF KEYWORDS", "DF Meta Description", "DF <h2>",
+    "DF верхнее описание", "DF основное описание", "DF ID", "SIM"
+]
 
-def process_products(product_urls: str, secret_key: str, google_creds: str, spreadsheet_id: str):
+
+def process_products(product_urls: str, secret_key: str, google_creds: str, spreadsheet_id: str,
+                     resume: bool = False, sheets: Optional[GoogleSheetsHandler] = None):
     start_time = time.time()
 
     # Инициализация компонентов
-    parser = DentalFirstParser()
-    scraper = CompetitorScraper()
-    generator = DescriptionGenerator(secret_key)
-    sheets = GoogleSheetsHandler(google_creds, spreadsheet_id)
-    products = parser.parse_products(product_urls)
-
-    # Создаем лист в таблице
-    sheet_name = 'Product Descriptions'
-    headers = [
-        "URL", "DF Номенклатура", "Бренд", "Страна", "DF Артикул",
-        "DF META TITLE", "DF KEYWORDS", "DF Meta Description", "DF <h2>",
-        "DF верхнее описание", "DF основное описание", "DF ID", "SIM"
-    ]
+    transport = HttpTransport.from_config()
+    parser = DentalFirstParser(transport)
+    scraper = CompetitorScraper(transport, ProductUrlIndex.from_config(), CatalogIndex.from_config())
+    generator = DescriptionGenerator(secret_key, transport, GenerationCache.from_config(),
+                                     SentenceDeduplicator.from_config())
+    sheets = sheets or GoogleSheetsHandler(google_creds, spreadsheet_id)
+    # Без --resume состояние прошлого прогона того же каталога сбрасывается
+    job_state = JobState.from_config(product_urls, resume)
+    delta = DeltaTracker.from_config()
+    exporter = MetricsExporter.from_config()
+
     results = []
-    combined_descriptions = []
-    total = len(products)
-
-    for idx, product in enumerate(products, start=1):
-        # Вывод прогресса
-        progress_percent = (idx / total) * 100
-        print(f"Progress: {progress_percent:.2f}% ({idx}/{total})")
-        try:
-            article_number = product["article_number"]
-            combined_description = scraper.search_product(article_number)
-            if not combined_description:
-                print(f"No descriptions found for {article_number}")
+    # Строки уходят в таблицу по ходу работы, а не в конце: падение прогона не теряет готовое;
+    # лист создаётся при первой выгрузке строк
+    writer = SheetsWriter.from_config(sheets, SHEET_NAME, HEADERS)
+
+    # Строки, выгруженные с текстами конкурентов, потому что генерация не удалась: при --resume генерация повторится
+    generation_failed = set()
+
+    def on_flush(rows: List[Dict[str, str]]):
+        # Товар считается выгруженным, только когда его строка действительно записана в таблицу
+        for row in rows:
+            key = row['DF ID'] or row['URL']
+            if key in generation_failed:
+                if delta:
+                    delta.discard(key)
                 continue
+            if job_state:
+                job_state.mark_done('export', key)
+            if delta:
+                delta.commit(key)
 
-            # # Генерируем новое описание
-            # generated = generator.generate_description(combined_description)
-            # if not generated:
-            #     print(f"Failed to generate description for {article_number}")
-            #     continue
-            #
-            # results.append(generated)
-
-            if combined_description:
-                print(f"Descriptions found for {article_number}")
-                combined_descriptions.append({
-                    'URL': product['url'],
-                    'DF Номенклатура': product['nomenclature'],
-                    'Бренд': product['brand'],
-                    'Страна': product['country'],
-                    'DF Артикул': product['article_number'],
-                    'DF META TITLE': combined_description['meta_title'],
-                    'DF KEYWORDS': combined_description['meta_keywords'],
-                    'DF Meta Description': combined_description['meta_description'],
-                    'DF <h2>': combined_description['h2'],
-                    'DF верхнее описание': combined_description['top_description'],
-                    'DF основное описание': combined_description['basic_description'],
-                    'DF ID': product['id'],
-                    'SIM': product['sim'], }
-                )
-
-        except Exception as e:
-            print(f"Error processing {product}: {str(e)}")
-            continue
+    writer.on_flush = on_flush
+
+    def export(item: Tuple[Dict[str, str], Optional[Dict[str, str]]]):
+        row, generated = item
+        if generated:
+            results.append(generated)
+        elif config.CONFIG.get('generate'):
+            generation_failed.add(row['DF ID'] or row['URL'])
+        writer.add(row)
 
-    # Записываем результаты в Google Sheets
-    if combined_descriptions:
-        sheets.create_sheet(sheet_name, headers)
-        sheets.append_data(sheet_name, combined_descriptions, headers)
+    stages = build_stages(lambda product: scrape_product(scraper, product, job_state, delta),
+                          generator, export, job_state)
+    # Товары приходят по мере разбора страниц каталога
+    try:
+        report = Pipeline(stages, config.CONFIG.get('pipeline', {}).get('queue_size', 20), source_name='catalog').run(
+            iter_source_products(parser, product_urls, job_state))
+    finally:
+        writer.close()
+        if job_state:
+            print(f"Job state: {job_state.summary()}")
+            job_state.close()
+        if delta:
+            print(f"Delta: {delta.report()}")
+            delta.close()
+        if exporter:
+            print_metrics(exporter.close(), exporter.summary_path)
+        parser.close()
+        scraper.close()
+        transport.close()
 
     end_time = time.time()
     print(f"Processing completed in {end_time - start_time:.2f} seconds")
-    print(f"Processed {len(results)} products out of {len(product_urls)}")
+    print(f"Pipeline: {report}")
+    print(f"Rows written to Google Sheets: {writer.written} {writer.stats or ''}")
+    if transport.cache:
+        print(f"HTTP cache: {transport.cache.stats()}")
+    if generator.cache:
+        print(f"Generation cache: {generator.cache.stats()}")
+    if generator.deduplicator:
+        print(f"Prompt deduplication: {generator.deduplicator.report()}")
+    print(f"Processed {int(report.get('export', {}).get('items', 0))} products "
+          f"out of {int(report.get('catalog', {}).get('items', 0))}")
 
     return results
 
 
+def build_stages(scrape, generator: DescriptionGenerator, export, job_state: Optional[JobState] = None) -> List[Stage]:
+    # Каталог -> конкуренты -> GigaChat -> строки таблицы: этапы работают одновременно
+    workers = config.CONFIG.get('pipeline', {}).get('workers', {})
+    stages = [Stage('scrape', scrape, workers.get('scrape', 4))]
+    if config.CONFIG.get('generate'):
+        stages.append(Stage('generate', lambda items: generate_descriptions(generator, items, job_state),
+                            workers.get('generate', generator.max_in_flight), batched=True,
+                            batch_size=generator.pack_size))
+    stages.append(Stage('format', format_product, workers.get('format', 1)))
+    stages.append(Stage('export', export))
+    return stages
+
+
+def enqueue_products(product_urls: str):
+    """Разбирает каталог Dental First и ставит товары в общую очередь для воркеров"""
+    start_time = time.time()
+    queue = WorkQueue.from_config()
+    parser = DentalFirstParser(HttpTransport.from_config())
+    try:
+        added = queue.enqueue((product_key(product), product) for product in iter_source_products(parser, product_urls))
+    finally:
+        parser.close()
+    print(f"Queued {added} new products in {time.time() - start_time:.2f} seconds: {queue.summary()}")
+    queue.close()
+
+
+def run_worker(secret_key: str, shards: Optional[List[int]] = None):
+    """Берёт товары из общей очереди в аренду и сохраняет готовые строки обратно в очередь"""
+    start_time = time.time()
+    queue = WorkQueue.from_config()
+    owner = f"{socket.gethostname()}-{os.getpid()}"
+    claim_size = config.CONFIG.get('work_queue', {}).get('claim_size', 20)
+    transport = HttpTransport.from_config()
+    scraper = CompetitorScraper(transport, ProductUrlIndex.from_config(), CatalogIndex.from_config())
+    generator = DescriptionGenerator(secret_key, transport, GenerationCache.from_config(),
+                                     SentenceDeduplicator.from_config())
+    delta = DeltaTracker.from_config()
+    exporter = MetricsExporter.from_config(owner)
+    processed = 0
+    print(f"Worker {owner} started, shards: {shards or 'all'}")
+
+    try:
+        while True:
+            claimed = queue.claim(owner, claim_size, shards)
+            if not claimed:
+                break
+            pending = {key for key, _ in claimed}
+
+            def scrape(product: Dict[str, str]):
+                key = product_key(product)
+                try:
+                    item = scrape_product(scraper, product, None, delta)
+                except Exception as e:
+                    pending.discard(key)
+                    queue.fail(owner, key, str(e))
+                    raise
+                if item is None:
+                    # Строки не будет (нет описаний конкурентов или товар не изменился), но товар обработан
+                    pending.discard(key)
+                    queue.complete(owner, key)
+                return item
+
+            def export(item: Tuple[Dict[str, str], Optional[Dict[str, str]]]):
+                row, generated = item
+                key = row['DF ID'] or row['URL']
+                pending.discard(key)
+                if generated is None and config.CONFIG.get('generate'):
+                    # Генерация не удалась: товар возвращается в очередь, генерацию повторит другой воркер
+                    queue.fail(owner, key, "Generation failed")
+                    if delta:
+                        delta.discard(key)
+                else:
+                    queue.complete(owner, key, row)
+                    if delta:
+                        delta.commit(key)
+                queue.renew(owner)
+
+            pipeline = Pipeline(build_stages(scrape, generator, export),
+                                config.CONFIG.get('pipeline', {}).get('queue_size', 20), source_name='queue')
+            pipeline.run(product for _, product in claimed)
+            processed += len(claimed) - len(pending)
+            if pipeline.interrupted:
+                # Не взятые в работу товары сразу возвращаются в очередь другим воркерам
+                queue.release(owner, pending)
+                break
+            for key in pending:
+                queue.fail(owner, key, "Pipeline error")
+    finally:
+        if delta:
+            print(f"Delta: {delta.report()}")
+            delta.close()
+        if exporter:
+            print_metrics(exporter.close(), exporter.summary_path)
+        print(f"Worker {owner} processed {processed} products in {time.time() - start_time:.2f} seconds")
+        print(f"Queue: {queue.summary()}")
+        queue.close()
+        scraper.close()
+        transport.close()
+
+
+def merge_results(google_creds: str, spreadsheet_id: str):
+    """Выгружает в таблицу строки, сохранённые воркерами во всех шардах"""
+    queue = WorkQueue.from_config()
+    writer = SheetsWriter.from_config(GoogleSheetsHandler(google_creds, spreadsheet_id), SHEET_NAME, HEADERS)
+    # Повторный --merge отправит только строки, которые ещё не были записаны в таблицу
+    writer.on_flush = lambda rows: queue.mark_merged([row['DF ID'] or row['URL'] for row in rows])
+    results = [row for _, row in queue.iter_results()]
+    # Число строк известно заранее - лист создаётся сразу под всю выгрузку
+    writer.expected_rows = len(results)
+    try:
+        for row in results:
+            writer.add(row)
+    finally:
+        writer.close()
+    print(f"Rows written to Google Sheets: {writer.written} {writer.stats or ''}")
+    print(f"Queue: {queue.summary()}")
+    queue.close()
+
+
+def print_metrics(summary: Dict, path: Optional[str] = None):
+    print(f"Time by activity, s: {summary['seconds_by_activity']}")
+    print(f"Cache hit rate: {summary['cache_hit_rate']}")
+    for stage, latency in summary['histograms'].get('pipeline_stage_seconds', {}).items():
+        print(f"  {stage}: {latency['count']} calls, p50 {latency['p50']:.3f}s, p95 {latency['p95']:.3f}s")
+    if path:
+        print(f"Metrics written to {path}")
+
+
+def parse_shards(value: str) -> List[int]:
+    """'0-3,8' -> [0, 1, 2, 3, 8]"""
+    shards = []
+    for part in value.split(','):
+        first, _, last = part.strip().partition('-')
+        shards.extend(range(int(first), int(last or first) + 1))
+    return shards
+
+
+def iter_source_products(parser: DentalFirstParser, product_urls: str,
+                         job_state: Optional[JobState] = None) -> Iterator[Dict[str, str]]:
+    crawl = config.CONFIG.get('catalog_crawl', {})
+    if not crawl.get('enabled'):
+        yield from parser.iter_products(product_urls, job_state=job_state)
+        return
+    roots = list(crawl.get('roots') or [])
+    if not roots:
+        roots = parser.discover_categories(crawl.get('discover_from') or product_urls,
+                                           crawl.get('navigation_selector') or CATEGORY_NAV_SELECTOR)
+        print(f"Discovered {len(roots)} categories")
+    yield from parser.iter_catalog(roots, crawl.get('max_pages'), job_state)
+
+
+def product_key(product: Dict[str, str]) -> str:
+    return product.get('id') or product['url']
+
+
+def scrape_product(scraper: CompetitorScraper, product: Dict[str, str], job_state: Optional[JobState] = None,
+                   delta: Optional[DeltaTracker] = None) -> Optional[Tuple[Dict, Dict, None]]:
+    article_number = product["article_number"]
+    key = product_key(product)
+    status = delta.status(key, product) if delta else None
+    if status == 'unchanged' and not delta.recheck_competitors:
+        delta.skip(key)
+        return None
+
+    saved = None
+    if job_state:
+        if job_state.load('export', key):
+            print(f"Already exported {article_number}, skipping")
+            return None
+        saved = job_state.load('scrape', key)
+    if saved is not None:
+        combined_description = saved['output']
+    else:
+        combined_description = search_competitors(scraper, product, key, job_state)
+    if not combined_description:
+        return None
+
+    if delta:
+        if status == 'unchanged':
+            # Товар тот же - генерация нужна, только если изменились описания конкурентов
+            status = delta.status(key, product, combined_description)
+            if status == 'unchanged':
+                delta.skip(key)
+                return None
+        delta.stage(key, product, combined_description, status)
+    return product, combined_description, None
+
+
+def search_competitors(scraper: CompetitorScraper, product: Dict[str, str], key: str,
+                       job_state: Optional[JobState] = None) -> Optional[Dict]:
+    article_number = product["article_number"]
+    print(f"Searching competitors for {article_number}")
+    try:
+        combined_description = scraper.search_product(article_number)
+    except Exception as e:
+        if job_state:
+            job_state.mark_failed('scrape', key, str(e))
+        raise
+    if job_state:
+        job_state.mark_done('scrape', key, combined_description or None)
+    if not combined_description:
+        print(f"No descriptions found for {article_number}")
+        return None
+
+    print(f"Descriptions found for {article_number}")
+    return combined_description
+
+
+def generate_descriptions(generator: DescriptionGenerator, items: List[Tuple[Dict, Dict, None]],
+                          job_state: Optional[JobState] = None) -> List[Tuple[Dict, Dict, Optional[Dict]]]:
+    saved = {}
+    if job_state:
+        saved = {product_key(product): job_state.load('generate', product_key(product)) for product, _, _ in items}
+    pending = [item for item in items if saved.get(product_key(item[0])) is None]
+    generations = iter(generator.generate_batch([combined_description for _, combined_description, _ in pending]))
+
+    generated = []
+    for product, combined_description, _ in items:
+        key = product_key(product)
+        if saved.get(key) is not None:
+            generated.append((product, combined_description, saved[key]['output']))
+            continue
+        generation = next(generations)
+        if generation.error:
+            print(f"Failed to generate description for {product['article_number']}: {generation.error}")
+            if job_state:
+                job_state.mark_failed('generate', key, generation.error)
+        elif job_state:
+            job_state.mark_done('generate', key, generation.result)
+        generated.append((product, combined_description, generation.result))
+    return generated
+
+
+def format_product(item: Tuple[Dict, Dict, Optional[Dict]]) -> Tuple[Dict[str, str], Optional[Dict[str, str]]]:
+    product, combined_description, generated = item
+    return build_row(product, combined_description, generated), generated
+
+
+def build_row(product: Dict[str, str], combined_description: Dict[str, str],
+              generated: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    row = {
+        'URL': product['url'],
+        'DF Номенклатура': product['nomenclature'],
+        'Бренд': product['brand'],
+        'Страна': product['country'],
+        'DF Артикул': product['article_number'],
+        'DF META TITLE': combined_description['meta_title'],
+        'DF KEYWORDS': combined_description['meta_keywords'],
+        'DF Meta Description': combined_description['meta_description'],
+        'DF <h2>': combined_description['h2'],
+        'DF верхнее описание': combined_description['top_description'],
+        'DF основное описание': combined_description['basic_description'],
+        'DF ID': product['id'],
+        'SIM': product['sim'],
+    }
+    if generated:
+        row.update({
+            'DF META TITLE': generated['title'],
+            'DF KEYWORDS': generated['keywords'],
+            'DF Meta Description': generated['meta_description'],
+            'DF основное описание': generated['text'],
+        })
+    return row
+
+
+def build_catalog_index():
+    start_time = time.time()
+    index = CatalogIndex.from_config()
+    if index is None:
+        print("Catalog index is disabled in config")
+        return
+    transport = HttpTransport.from_config()
+    scraper = CompetitorScraper(transport)
+    try:
+        counts = CatalogIndexBuilder(scraper, index).build()
+    finally:
+        scraper.close()
+        index.close()
+        transport.close()
+    print(f"Catalog index built in {time.time() - start_time:.2f} seconds: {counts}")
+
+
 if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Dental First product description generator")
+    arg_parser.add_argument('--build-index', action='store_true',
+                            help="Обойти каталоги конкурентов и собрать локальный индекс артикулов")
+    arg_parser.add_argument('--resume', action='store_true',
+                            help="Продолжить прерванный прогон: пропустить уже выполненные этапы по каждому товару")
+    arg_parser.add_argument('--force-regenerate', action='store_true',
+                            help="Не брать описания из кэша генерации, генерировать заново")
+    arg_parser.add_argument('--enqueue', action='store_true',
+                            help="Разобрать каталог и поставить товары в общую очередь (work_queue)")
+    arg_parser.add_argument('--worker', action='store_true',
+                            help="Обрабатывать товары из общей очереди; можно запустить несколько процессов и машин")
+    arg_parser.add_argument('--shards', type=parse_shards, default=None,
+                            help="Шарды для воркера, например 0-7 или 0,2,4 (по умолчанию все)")
+    arg_parser.add_argument('--merge', action='store_true',
+                            help="Выгрузить в Google Sheets строки, собранные воркерами")
+    args = arg_parser.parse_args()
+    if args.force_regenerate:
+        config.CONFIG.setdefault('generation_cache', {})['force'] = True
+
     # Конфигурация
     PRODUCT_URLS = config.CONFIG["dental_first_url"]
     OPENAI_KEY = config.CONFIG["client_secret"]
@@ -88,4 +419,13 @@ if __name__ == "__main__":
     SPREADSHEET_ID = config.CONFIG["spreadsheet_id"]
 
     # Запуск обработки
-    process_products(PRODUCT_URLS, OPENAI_KEY, GOOGLE_CREDS, SPREADSHEET_ID)
+    if args.build_index:
+        build_catalog_index()
+    elif args.enqueue:
+        enqueue_products(PRODUCT_URLS)
+    elif args.worker:
+        run_worker(OPENAI_KEY, args.shards)
+    elif args.merge:
+        merge_results(GOOGLE_CREDS, SPREADSHEET_ID)
+    else:
+        process_products(PRODUCT_URLS, OPENAI_KEY, GOOGLE_CREDS, SPREADSHEET_ID, resume=args.resume)
@@ -0,0 +1,230 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+import config
+
+# Границы корзин гистограмм в секундах: от ответов из кэша до долгих ответов GigaChat
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+PROMETHEUS_PREFIX = 'df_'
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Последняя корзина - больше самой большой границы (+Inf)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля по корзинам с линейной интерполяцией внутри корзины, как histogram_quantile"""
+        rank = q * self.count
+        seen = 0
+        for position, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[position - 1] if position else 0.0
+                upper = self.buckets[position] if position < len(self.buckets) else self.max
+                return min(self.max, lower + (upper - lower) * (rank - seen) / count)
+            seen += count
+        return self.max
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'avg': round(self.sum / self.count, 6) if self.count else 0.0,
+            'p50': round(self.quantile(0.5), 6),
+            'p95': round(self.quantile(0.95), 6),
+            'max': round(self.max, 6),
+        }
+
+
+class Metrics:
+    """Счётчики и гистограммы задержек с метками (этап, сайт, статус): куда на самом деле уходит время прогона"""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._counters = defaultdict(float)
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, value: float = 1, **labels):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name, tuple(sorted(labels.items()))] += value
+
+    def observe(self, name: str, seconds: float, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def counter(self, name: str, **labels) -> float:
+        """Сумма счётчика по всем сериям, у которых совпадают указанные метки"""
+        with self._lock:
+            return sum(value for (counter, series), value in self._counters.items()
+                       if counter == name and set(labels.items()) <= set(series))
+
+    def histogram(self, name: str, **labels) -> Optional[Dict[str, float]]:
+        with self._lock:
+            histogram = self._histograms.get((name, tuple(sorted(labels.items()))))
+            return histogram.snapshot() if histogram else None
+
+    def summary(self) -> Dict:
+        with self._lock:
+            counters = defaultdict(dict)
+            for (name, labels), value in sorted(self._counters.items()):
+                counters[name][self._series_name(labels)] = value
+            histograms = defaultdict(dict)
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                histograms[name][self._series_name(labels)] = histogram.snapshot()
+            seconds = defaultdict(float)
+            for (name, _), histogram in self._histograms.items():
+                seconds[name] += histogram.sum
+        return {
+            # Суммарное время по видам работы; в многопоточном прогоне больше общего времени работы
+            'seconds_by_activity': {
+                'http': round(seconds['http_request_seconds'], 3),
+                'html_parse': round(seconds['html_parse_seconds'], 3),
+                'llm': round(seconds['llm_request_seconds'], 3),
+                'sheets': round(seconds['sheets_write_seconds'], 3),
+            },
+            'cache_hit_rate': {
+                'http': self._hit_rate('http_cache_total'),
+                'generation': self._hit_rate('generation_cache_total'),
+            },
+            'counters': dict(counters),
+            'histograms': dict(histograms),
+        }
+
+    def _hit_rate(self, name: str) -> float:
+        hits = self.counter(name, outcome='hits') + self.counter(name, outcome='revalidated')
+        total = self.counter(name)
+        return round(hits / total, 4) if total else 0.0
+
+    @staticmethod
+    def _series_name(labels: Tuple) -> str:
+        return ','.join(f'{key}={value}' for key, value in labels) or 'all'
+
+    def prometheus_text(self) -> str:
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items())
+        declared = set()
+        for (name, labels), value in counters:
+            name = PROMETHEUS_PREFIX + name
+            if name not in declared:
+                declared.add(name)
+                lines.append(f'# TYPE {name} counter')
+            lines.append(f'{name}{self._prometheus_labels(labels)} {value:g}')
+        for (name, labels), histogram in histograms:
+            name = PROMETHEUS_PREFIX + name
+            if name not in declared:
+                declared.add(name)
+                lines.append(f'# TYPE {name} histogram')
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{self._prometheus_labels(labels + (("le", bound),))} {cumulative}')
+            lines.append(f'{name}_sum{self._prometheus_labels(labels)} {histogram.sum:.6f}')
+            lines.append(f'{name}_count{self._prometheus_labels(labels)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _prometheus_labels(labels: Tuple) -> str:
+        if not labels:
+            return ''
+        escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+        return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+
+METRICS = Metrics(config.CONFIG.get('metrics', {}).get('enabled', True))
+
+
+def _write_atomic(path: str, text: str):
+    # Файл подменяется целиком: сборщик метрик никогда не прочитает его наполовину записанным
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        file.write(text)
+    os.replace(temp_path, path)
+
+
+class MetricsExporter:
+    """Пишет метрики в текстовый файл Prometheus каждые interval секунд и JSON-сводку в конце прогона"""
+
+    def __init__(self, metrics: Metrics, summary_path: Optional[str] = None, prometheus_path: Optional[str] = None,
+                 interval: float = 15):
+        self.metrics = metrics
+        self.summary_path = summary_path
+        self.prometheus_path = prometheus_path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        if prometheus_path:
+            self._thread = threading.Thread(target=self._export_periodically, name='metrics-exporter', daemon=True)
+            self._thread.start()
+
+    @classmethod
+    def from_config(cls, suffix: Optional[str] = None) -> Optional['MetricsExporter']:
+        """suffix добавляется к именам файлов, чтобы несколько воркеров на одной машине не перезаписывали друг друга"""
+        settings = config.CONFIG.get('metrics', {})
+        if not settings.get('enabled', True):
+            return None
+        paths = [settings.get('summary_path', 'metrics.json'), settings.get('prometheus_path')]
+        if suffix:
+            paths = [f'{os.path.splitext(path)[0]}-{suffix}{os.path.splitext(path)[1]}' if path else path
+                     for path in paths]
+        return cls(METRICS, paths[0], paths[1], settings.get('prometheus_interval', 15))
+
+    def _export_periodically(self):
+        while not self._stop.wait(self.interval):
+            self.write_prometheus()
+
+    def write_prometheus(self):
+        try:
+            _write_atomic(self.prometheus_path, self.metrics.prometheus_text())
+        except OSError as e:
+            print(f"Error writing metrics to {self.prometheus_path}: {str(e)}")
+
+    def close(self) -> Dict:
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self.write_prometheus()
+        summary = self.metrics.summary()
+        if self.summary_path:
+            try:
+                _write_atomic(self.summary_path, json.dumps(summary, ensure_ascii=False, indent=2))
+            except OSError as e:
+                print(f"Error writing metrics to {self.summary_path}: {str(e)}")
+        return summary
@@ -1,65 +1,277 @@
-from typing import List, Dict, Optional
-from urllib.parse import urljoin
-import requests
+import multiprocessing
+import re
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from typing import List, Dict, Optional, Iterator, Tuple
+from urllib.parse import urljoin, urlsplit, urlunsplit
 from bs4 import BeautifulSoup
+from html_engine import make_soup
+from job_state import JobState
+from metrics import METRICS
+from transport import HttpTransport
 import config
 
+NEXT_PAGE_SELECTOR = (
+    'link[rel="next"][href], a[rel="next"][href], a.pagination__next[href], '
+    'a.modern-page-next[href], li.bx-pag-next a[href]'
+)
+LOAD_MORE_SELECTOR = '.ajax_load_btn[data-url], .load-more[data-url], [data-next-page]'
+# Блоки страницы товара, которые читает _parse_product_page (для частичного разбора HTML)
+PRODUCT_PAGE_TARGETS = ['meta', 'h1.main-slider__title', 'div#descr-text', 'span']
+PAGE_PARAM_RE = re.compile(r'(?:PAGEN_\d+|[?&]page)=(\d+)')
+CATEGORY_NAV_SELECTOR = '.catalog-menu a[href], nav a[href*="/catalog/"]'
+
+
+def find_next_page(soup: BeautifulSoup, url: str) -> Optional[str]:
+    """Ищет ссылку на следующую страницу каталога (пагинация или кнопка "Показать ещё")"""
+    next_elem = soup.select_one(NEXT_PAGE_SELECTOR)
+    if next_elem:
+        return urljoin(url, next_elem['href'])
+
+    load_more = soup.select_one(LOAD_MORE_SELECTOR)
+    if load_more:
+        return urljoin(url, load_more.get('data-url') or load_more.get('data-next-page'))
+
+    # Нумерованная пагинация: ссылка вида ?PAGEN_1=<текущая + 1> (Битрикс) или &page=<текущая + 1>
+    current_page = 1
+    match = PAGE_PARAM_RE.search(url)
+    if match:
+        current_page = int(match.group(1))
+    for link in soup.find_all('a', href=PAGE_PARAM_RE):
+        match = PAGE_PARAM_RE.search(link['href'])
+        if int(match.group(1)) == current_page + 1:
+            return urljoin(url, link['href'])
+    return None
+
+
+def normalize_url(url: str, keep_query: bool = True) -> str:
+    parts = urlsplit(url)
+    path = parts.path if parts.path.endswith('/') else parts.path + '/'
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, parts.query if keep_query else '', ''))
+
+
+class ProductFrontier:
+    """Множество уже взятых товаров при обходе нескольких категорий: товар загружается и отдаётся один раз"""
+
+    def __init__(self, keep_query: bool = False):
+        # Товар на Dental First определяется путём, параметры в ссылке - это категория или метки перехода
+        self.keep_query = keep_query
+        self.links = set()
+        self.products = set()
+        self.count = 0
+        self.duplicates = 0
+
+    def claim_link(self, link: str) -> bool:
+        key = normalize_url(link, self.keep_query)
+        if key in self.links:
+            self.duplicates += 1
+            return False
+        self.links.add(key)
+        return True
+
+    def claim_product(self, record: Dict[str, str]) -> bool:
+        # Один товар может быть доступен по разным ссылкам (с параметрами категории) - сверяем og:url и ID
+        keys = [key for key in (record.get('url') and normalize_url(record['url']),
+                                record.get('id') and f"id:{record['id']}") if key]
+        if any(key in self.products for key in keys):
+            self.duplicates += 1
+            return False
+        self.products.update(keys)
+        self.count += 1
+        # Канонический адрес тоже считается взятым: ссылка на него в другой категории не загрузится
+        if record.get('url'):
+            self.links.add(normalize_url(record['url'], self.keep_query))
+        return True
+
 
 class DentalFirstParser:
-    def __init__(self):
+    def __init__(self, transport: Optional[HttpTransport] = None):
 
-        self.session = requests.Session()
-        self.session.headers.update({'User-Agent': 'Mozilla/5.0 (compatible; Bot/1.0)'})
+        self.transport = transport or HttpTransport()
+        self.session = self.transport.session({'User-Agent': 'Mozilla/5.0 (compatible; Bot/1.0)'})
+        self.max_workers = config.CONFIG.get('parser_workers', 1)
+        self.parse_processes = config.CONFIG.get('parser_processes', 0)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers) if self.max_workers > 1 else None
+        # BeautifulSoup держит GIL, поэтому разбор страниц можно вынести в отдельные процессы.
+        # spawn, а не fork: fork процесса с работающими потоками (пулы соединений, загрузка) может зависнуть
+        self.process_pool = ProcessPoolExecutor(
+            max_workers=self.parse_processes, mp_context=multiprocessing.get_context('spawn')
+        ) if self.parse_processes > 0 else None
 
     def parse_products(self, url: str) -> List[Dict[str, str]]:
+        return list(self.iter_products(url))
+
+    def iter_products(self, url: str, max_pages: Optional[int] = None,
+                      job_state: Optional[JobState] = None) -> Iterator[Dict[str, str]]:
+        """Обходит страницы каталога и отдаёт товары по мере разбора.
+
+        С job_state уже разобранные в прерванном прогоне товары берутся из него, без загрузки страницы.
+        """
+        for links in self._iter_catalog_links(url, max_pages):
+            yield from self._iter_product_records(links, job_state)
+
+    def iter_catalog(self, roots: List[str], max_pages: Optional[int] = None,
+                     job_state: Optional[JobState] = None) -> Iterator[Dict[str, str]]:
+        """Обходит несколько категорий; товар, который есть в нескольких категориях, загружается один раз"""
+        frontier = ProductFrontier()
+        for root in roots:
+            print(f"Crawling category {root}")
+            for links in self._iter_catalog_links(root, max_pages):
+                for record in self._iter_product_records([link for link in links if frontier.claim_link(link)], job_state):
+                    if frontier.claim_product(record):
+                        yield record
+        print(f"Catalog crawl: {frontier.count} products, {frontier.duplicates} duplicates skipped")
+
+    def discover_categories(self, url: str, selector: str = CATEGORY_NAV_SELECTOR) -> List[str]:
+        """Корневые категории из меню каталога на странице url"""
+        soup = self._get_catalog_page(url)
+        host = urlsplit(url).netloc
+        categories = []
+        for link in soup.select(selector):
+            category = urljoin(url, link['href'])
+            if urlsplit(category).netloc == host and category not in categories:
+                categories.append(category)
+        return categories
+
+    def _iter_catalog_links(self, url: str, max_pages: Optional[int] = None) -> Iterator[List[str]]:
+        visited = set()
+        page_url = url
+        pending = self._submit(self._get_catalog_page, page_url)
+        while pending is not None:
+            visited.add(page_url)
+            try:
+                soup = pending.result()
+                links = self._get_product_links(soup, page_url)
+                next_url = find_next_page(soup, page_url)
+            except Exception as e:
+                print(f"Error parsing Dental First catalog: {str(e)}")
+                return
+
+            # Следующая страница загружается, пока разбираются товары текущей
+            pending = None
+            if next_url and next_url not in visited and (max_pages is None or len(visited) < max_pages):
+                page_url = next_url
+                pending = self._submit(self._get_catalog_page, page_url)
+
+            yield links
+
+    def _get_catalog_page(self, url: str) -> BeautifulSoup:
+        response = self.session.get(url)
+        response.raise_for_status()
+        with METRICS.timer('html_parse_seconds', host=urlsplit(url).netloc, page='catalog'):
+            return make_soup(response.text)
+
+    def _get_product_links(self, soup: BeautifulSoup, url: str) -> List[str]:
+        # Ответ на AJAX-подгрузку может содержать только карточки без общего контейнера
+        product_blocks = soup.find('div', class_='set-row block-card ajaxelem') or soup
+
+        product_cards = product_blocks.find_all('div', class_='set-card block')
+
+        links = []
+        for block in product_cards:
+            try:
+                # Извлечение ссылки на продукт
+                link_elem = block.find('a', class_='di_b c_b', href=True)
+                link = urljoin(url, link_elem['href']) if link_elem else None
+                if link:
+                    links.append(link)
+            except Exception as e:
+                print(f"Error parsing product block: {str(e)}")
+                continue
+        return links
+
+    def _iter_product_records(self, links: List[str], job_state: Optional[JobState] = None) -> Iterator[Dict[str, str]]:
+        saved = {}
+        if job_state:
+            saved = {link: job_state.load('parse', link) for link in links}
+        for link in links:
+            if saved.get(link) is not None:
+                yield saved[link]['output']
+        # Страницы товаров загружаются параллельно; при разборе в процессах товары идут по мере готовности
+        for link, product_info in self._get_products_info([link for link in links if saved.get(link) is None]):
+            record = self._make_record(product_info)
+            if job_state:
+                # Неудачная загрузка повторится при следующем --resume
+                if record:
+                    job_state.mark_done('parse', link, record)
+                else:
+                    job_state.mark_failed('parse', link, "product page not parsed")
+            if record:
+                yield record
+
+    @staticmethod
+    def _make_record(product_info: Optional[Dict[str, str]]) -> Optional[Dict[str, str]]:
         try:
-            response = self.session.get(url)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-
-            product_information = []
-            product_blocks = soup.find('div', class_='set-row block-card ajaxelem')
-
-            product_cards = product_blocks.find_all('div', class_='set-card block')
-
-            for block in product_cards:
-                try:
-                    # Извлечение информации о продукте
-                    link_elem = block.find('a', class_='di_b c_b', href=True)
-                    link = urljoin(url, link_elem['href']) if link_elem else None
-                    if link:
-                        product_info = self._get_product_info(link)
-                        if product_info:
-                            product_information.append({
-                                'url': product_info['url'],
-                                'nomenclature': product_info['nomenclature'],
-                                'brand': product_info['brand'],
-                                'country': product_info['country'],
-                                'article_number': product_info['article_number'],
-                                'meta_title': product_info['meta_title'],
-                                'meta_keywords': product_info['meta_keywords'],
-                                'meta_description': product_info['meta_description'],
-                                'h2': "",
-                                'top_description': "",
-                                'basic_description': product_info['description'],
-                                'id': product_info['id'],
-                                'sim': product_info['sim'],
-                            })
-                except Exception as e:
-                    print(f"Error parsing product block: {str(e)}")
-                    continue
-
-            return product_information
+            if product_info:
+                return {
+                    'url': product_info['url'],
+                    'nomenclature': product_info['nomenclature'],
+                    'brand': product_info['brand'],
+                    'country': product_info['country'],
+                    'article_number': product_info['article_number'],
+                    'meta_title': product_info['meta_title'],
+                    'meta_keywords': product_info['meta_keywords'],
+                    'meta_description': product_info['meta_description'],
+                    'h2': "",
+                    'top_description': "",
+                    'basic_description': product_info['description'],
+                    'id': product_info['id'],
+                    'sim': product_info['sim'],
+                }
+        except Exception as e:
+            print(f"Error parsing product block: {str(e)}")
+        return None
 
+    def _submit(self, fn, *args) -> Future:
+        if self.executor:
+            return self.executor.submit(fn, *args)
+        future = Future()
+        try:
+            future.set_result(fn(*args))
         except Exception as e:
-            print(f"Error parsing Dental First catalog: {str(e)}")
-            return []
+            future.set_exception(e)
+        return future
+
+    def _get_products_info(self, links: List[str]) -> Iterator[Tuple[str, Optional[Dict[str, str]]]]:
+        """(ссылка, данные товара); в процессах - в порядке готовности, иначе в порядке карточек"""
+        if self.executor is None:
+            return ((link, self._get_product_info(link)) for link in links)
+        if self.process_pool is None:
+            return zip(links, self.executor.map(self._get_product_info, links))
+        return self._fetch_and_parse_in_processes(links)
+
+    def _fetch_and_parse_in_processes(self, links: List[str]) -> Iterator[Tuple[str, Optional[Dict[str, str]]]]:
+        # Каждая страница отправляется на разбор сразу после загрузки, не дожидаясь остальных страниц пачки
+        futures = {self.executor.submit(self._fetch_and_parse_page, link): link for link in links}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+    def _fetch_and_parse_page(self, url: str) -> Optional[Dict[str, str]]:
+        html = self._fetch_product_page(url)
+        if html is None:
+            return None
+        return self.process_pool.submit(self._parse_product_page, html, url).result()
 
     def _get_product_info(self, url: str) -> Optional[Dict[str, str]]:
+        html = self._fetch_product_page(url)
+        if html is None:
+            return None
+        # При разборе в процессах (parser_processes) время разбора здесь не учитывается
+        with METRICS.timer('html_parse_seconds', host=urlsplit(url).netloc, page='product'):
+            return self._parse_product_page(html, url)
+
+    def _fetch_product_page(self, url: str) -> Optional[str]:
         try:
             response = self.session.get(url)
             response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
+            return response.text
+        except Exception as e:
+            print(f"Error getting description from {url}: {str(e)}")
+            return None
+
+    @staticmethod
+    def _parse_product_page(html: str, url: str) -> Optional[Dict[str, str]]:
+        try:
+            soup = make_soup(html, PRODUCT_PAGE_TARGETS)
             meta_url_tag = soup.find('meta', property='og:url', content=True)['content']
             meta_keywords_tag = soup.find('meta', attrs={'name': 'keywords', 'content': True})['content']
             meta_description_tag = soup.find('meta', property='og:description', content=True)['content']
@@ -76,13 +288,13 @@ class DentalFirstParser:
             url = meta_url_tag if meta_url_tag else None
             nomenclature = title_tag.get_text(strip=True) if title_tag else None
             brand = brand_tag.get_text(strip=True) if brand_tag else None
-            country = self.get_value_after_label(country_tag, "Страна:") if country_tag else None
-            article_number = self.get_value_after_label(article_number_tag, "Артикул:") if article_number_tag else None
+            country = DentalFirstParser.get_value_after_label(country_tag, "Страна:") if country_tag else None
+            article_number = DentalFirstParser.get_value_after_label(article_number_tag, "Артикул:") if article_number_tag else None
             meta_title = meta_title_tag if meta_title_tag else None
             meta_keywords = meta_keywords_tag if meta_keywords_tag else None
             meta_description = meta_description_clean_text if meta_description_clean_text else None
-            id = self.get_value_after_label(id_tag, "ID:") if id_tag else None
-            product_code = self.get_value_after_label(product_code_tag, "Код товара:") if product_code_tag else None
+            id = DentalFirstParser.get_value_after_label(id_tag, "ID:") if id_tag else None
+            product_code = DentalFirstParser.get_value_after_label(product_code_tag, "Код товара:") if product_code_tag else None
             description = desc_tag.get_text(' ', strip=True) if desc_tag else None
 
             return {
@@ -102,7 +314,14 @@ class DentalFirstParser:
             print(f"Error getting description from {url}: {str(e)}")
             return None
 
-    def get_value_after_label(self, span, label):
+    def close(self):
+        if self.executor:
+            self.executor.shutdown(wait=True)
+        if self.process_pool:
+            self.process_pool.shutdown(wait=True)
+
+    @staticmethod
+    def get_value_after_label(span, label):
         if span:
             text = span.get_text(separator=' ', strip=True)
             if text.startswith(label):
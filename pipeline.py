@@ -0,0 +1,163 @@
+import queue
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Optional
+from metrics import METRICS
+
+_DONE = object()  # Конец потока данных: передаётся от этапа к этапу
+
+
+class Stage:
+    """Этап конвейера: func(item) -> item для следующего этапа или None, если элемент дальше не идёт.
+
+    С batched=True func получает список элементов (до batch_size) и возвращает список результатов.
+    """
+
+    def __init__(self, name: str, func: Callable, workers: int = 1, batched: bool = False, batch_size: int = 1,
+                 queue_size: Optional[int] = None, batch_timeout: float = 0.5):
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.batched = batched
+        self.batch_size = max(1, batch_size)
+        self.queue_size = queue_size
+        self.batch_timeout = batch_timeout
+
+
+class Pipeline:
+    """Этапы в отдельных потоках, между ними ограниченные очереди: быстрый этап ждёт, пока медленный разберёт очередь.
+
+    Первый Ctrl-C перестаёт брать новые элементы из источника и дорабатывает уже взятые, второй - прерывает всё.
+    """
+
+    def __init__(self, stages: List[Stage], queue_size: int = 20, source_name: str = 'source'):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.source_name = source_name
+        self.stats = defaultdict(lambda: defaultdict(float))
+        self._queues = [queue.Queue(maxsize=stage.queue_size or queue_size) for stage in stages]
+        self._remaining = [stage.workers for stage in stages]
+        self._lock = threading.Lock()
+        self._draining = threading.Event()
+        self._aborted = threading.Event()
+
+    def run(self, source: Iterable) -> Dict[str, Dict[str, float]]:
+        threads = [threading.Thread(target=self._feed, args=(source,), name=self.source_name, daemon=True)]
+        for position, stage in enumerate(self.stages):
+            for number in range(stage.workers):
+                threads.append(threading.Thread(target=self._work, args=(position,),
+                                                name=f'{stage.name}-{number}', daemon=True))
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            while thread.is_alive():
+                try:
+                    thread.join(0.2)
+                except KeyboardInterrupt:
+                    if self._draining.is_set():
+                        print("Aborting pipeline")
+                        self._aborted.set()
+                    else:
+                        print("Stopping: finishing items already in progress (Ctrl-C again to abort)")
+                        self._draining.set()
+        return self.report()
+
+    @property
+    def interrupted(self) -> bool:
+        return self._draining.is_set() or self._aborted.is_set()
+
+    def _feed(self, source: Iterable):
+        try:
+            for item in source:
+                if self._draining.is_set() or self._aborted.is_set():
+                    break
+                self.stats[self.source_name]['items'] += 1
+                if not self._put(0, item):
+                    break
+        except Exception as e:
+            print(f"Error in pipeline source: {str(e)}")
+        finally:
+            self._put(0, _DONE, force=True)
+
+    def _work(self, position: int):
+        stage = self.stages[position]
+        stats = self.stats[stage.name]
+        while True:
+            batch, done = self._take(position, stage)
+            if batch and not self._aborted.is_set():
+                started = time.monotonic()
+                try:
+                    results = stage.func(batch) if stage.batched else [stage.func(batch[0])]
+                except Exception as e:
+                    print(f"Error in pipeline stage {stage.name}: {str(e)}")
+                    stats['errors'] += len(batch)
+                    METRICS.increment('pipeline_errors_total', len(batch), stage=stage.name)
+                    results = []
+                elapsed = time.monotonic() - started
+                # Для этапов с пачками - время обработки всей пачки
+                METRICS.observe('pipeline_stage_seconds', elapsed, stage=stage.name)
+                METRICS.increment('pipeline_items_total', len(batch), stage=stage.name)
+                with self._lock:
+                    stats['busy_seconds'] += elapsed
+                    stats['items'] += len(batch)
+                    if position + 1 < len(self.stages):
+                        stats['dropped'] += sum(result is None for result in results)
+                if position + 1 < len(self.stages):
+                    for result in results:
+                        if result is not None and not self._put(position + 1, result):
+                            break
+            if done:
+                break
+        with self._lock:
+            self._remaining[position] -= 1
+            last = self._remaining[position] == 0
+        if last and position + 1 < len(self.stages):
+            self._put(position + 1, _DONE, force=True)
+
+    def _take(self, position: int, stage: Stage):
+        """Забирает до batch_size элементов; второй элемент результата - пришёл ли конец потока"""
+        batch = []
+        deadline = None
+        while len(batch) < stage.batch_size:
+            if self._aborted.is_set():
+                return batch, True
+            # Первого элемента ждём сколько угодно, остальные добираем не дольше batch_timeout
+            timeout = 0.2 if deadline is None else min(0.2, deadline - time.monotonic())
+            if deadline is not None and timeout <= 0:
+                break
+            try:
+                item = self._queues[position].get(timeout=timeout)
+            except queue.Empty:
+                continue
+            if item is _DONE:
+                # Возвращаем метку для остальных потоков этого этапа
+                self._queues[position].put(_DONE)
+                return batch, True
+            batch.append(item)
+            if deadline is None:
+                deadline = time.monotonic() + stage.batch_timeout
+        return batch, False
+
+    def _put(self, position: int, item, force: bool = False) -> bool:
+        while not self._aborted.is_set() or force:
+            try:
+                self._queues[position].put(item, timeout=0.2)
+                return True
+            except queue.Full:
+                if force and self._aborted.is_set():
+                    # При прерывании очередь никто не разбирает - освобождаем место для метки конца
+                    self._drain(position)
+        return False
+
+    def _drain(self, position: int):
+        try:
+            while True:
+                self._queues[position].get_nowait()
+        except queue.Empty:
+            pass
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {name: dict(values) for name, values in self.stats.items()}
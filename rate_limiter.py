@@ -0,0 +1,132 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+import config
+
+THROTTLE_STATUSES = (429, 503)
+
+
+class HostRateLimiter:
+    """Token bucket на каждый домен с адаптивным замедлением на 429/503 и случайным разбросом интервалов"""
+
+    def __init__(self, limits: Optional[Dict[str, Dict]] = None, jitter: float = 0.3,
+                 backoff_factor: float = 0.5, recovery: float = 0.05, min_rate: float = 0.05):
+        self.limits = dict(limits or {})
+        self.default = self.limits.pop('default', {'rate': 1.0, 'burst': 1})
+        self.jitter = jitter
+        self.backoff_factor = backoff_factor
+        self.recovery = recovery
+        self.min_rate = min_rate
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls) -> 'HostRateLimiter':
+        settings = config.CONFIG.get('rate_limiter', {})
+        return cls(
+            settings.get('limits'),
+            jitter=settings.get('jitter', 0.3),
+            backoff_factor=settings.get('backoff_factor', 0.5),
+            recovery=settings.get('recovery', 0.05),
+            min_rate=settings.get('min_rate', 0.05),
+        )
+
+    def _limit_for(self, host: str) -> Dict:
+        for domain, limit in self.limits.items():
+            if host == domain or host.endswith('.' + domain):
+                return limit
+        return self.default
+
+    def _bucket(self, host: str) -> Dict:
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            limit = self._limit_for(host)
+            bucket = {
+                'base_rate': limit['rate'],
+                'rate': limit['rate'],
+                'burst': limit.get('burst', 1),
+                'tokens': limit.get('burst', 1),
+                'updated': time.monotonic(),
+                'blocked_until': 0.0,
+            }
+            self._buckets[host] = bucket
+        return bucket
+
+    def acquire(self, url: str):
+        host = urlparse(url).hostname or ''
+        while True:
+            with self._lock:
+                bucket = self._bucket(host)
+                now = time.monotonic()
+                bucket['tokens'] = min(bucket['burst'], bucket['tokens'] + (now - bucket['updated']) * bucket['rate'])
+                bucket['updated'] = now
+                if now < bucket['blocked_until']:
+                    wait = bucket['blocked_until'] - now
+                elif bucket['tokens'] >= 1:
+                    bucket['tokens'] -= 1
+                    spacing = random.uniform(0, self.jitter / bucket['rate'])
+                    break
+                else:
+                    wait = (1 - bucket['tokens']) / bucket['rate']
+            time.sleep(wait)
+        # Случайная добавка к интервалу, чтобы запросы не шли ровной сеткой
+        time.sleep(spacing)
+
+    def feedback(self, url: str, response: requests.Response):
+        host = urlparse(url).hostname or ''
+        with self._lock:
+            bucket = self._bucket(host)
+            if response.status_code in THROTTLE_STATUSES:
+                bucket['rate'] = max(self.min_rate, bucket['rate'] * self.backoff_factor)
+                delay = self._retry_after(response.headers.get('Retry-After'))
+                if delay is None:
+                    delay = 1 / bucket['rate']
+                bucket['blocked_until'] = max(bucket['blocked_until'], time.monotonic() + delay)
+                bucket['tokens'] = 0
+                print(f"Throttled by {host} ({response.status_code}), slowing down to {bucket['rate']:.2f} req/s")
+            elif response.status_code < 400 and bucket['rate'] < bucket['base_rate']:
+                bucket['rate'] = min(bucket['base_rate'], bucket['rate'] + bucket['base_rate'] * self.recovery)
+
+    @staticmethod
+    def _retry_after(value: Optional[str]) -> Optional[float]:
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    def current_rates(self) -> Dict[str, float]:
+        with self._lock:
+            return {host: bucket['rate'] for host, bucket in self._buckets.items()}
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """HTTPAdapter, который пропускает запросы через HostRateLimiter и повторяет их после 429/503"""
+
+    def __init__(self, rate_limiter: Optional[HostRateLimiter], throttle_retries: int = 2, **kwargs):
+        super().__init__(**kwargs)
+        self.rate_limiter = rate_limiter
+        self.throttle_retries = throttle_retries
+
+    def send(self, request, **kwargs):
+        if self.rate_limiter is None:
+            return super().send(request, **kwargs)
+        for attempt in range(self.throttle_retries + 1):
+            self.rate_limiter.acquire(request.url)
+            response = super().send(request, **kwargs)
+            self.rate_limiter.feedback(request.url, response)
+            if response.status_code not in THROTTLE_STATUSES or attempt == self.throttle_retries:
+                return response
+            response.close()
+        return response
+
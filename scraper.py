@@ -1,48 +1,127 @@
-from datetime import time
-from random import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
-from urllib.parse import urljoin
+from urllib.parse import urljoin, urlparse
 import requests
 from bs4 import BeautifulSoup
 from fake_useragent import UserAgent
+from catalog_index import CatalogIndex
+from html_engine import make_soup
+from metrics import METRICS
+from transport import HttpTransport
+from url_index import ProductUrlIndex
 import config
 
+# Блоки страницы товара, которые нужны для описания (для частичного разбора HTML)
+DESCRIPTION_TARGETS = {
+    'el-dent.ru': ['meta', 'h2', 'p.vadim-p', 'div[itemprop=description]'],
+    'aveldent.ru': ['meta', 'h1', 'div.description[itemprop=description]', 'p.description[itemprop=description]'],
+    'www.nika-dent.ru': ['meta', 'div.info-content'],
+    'w-stom.ru': ['meta', 'div#detailText'],
+}
+
 
 class CompetitorScraper:
-    def __init__(self):
+    def __init__(self, transport: Optional[HttpTransport] = None, url_index: Optional[ProductUrlIndex] = None,
+                 catalog_index: Optional[CatalogIndex] = None):
         self.ua = UserAgent()
-        self.session = requests.Session()
-        self.session.headers.update({
+        self.transport = transport or HttpTransport()
+        self.session = self.transport.session({
             'User-Agent': self.ua.random,
             'Referer': 'https://stomatorg.ru/'
         })
+        self.url_index = url_index
+        self.catalog_index = catalog_index
+        self.max_workers = config.CONFIG.get('competitor_workers', 1)
+        self.per_host_concurrency = config.CONFIG.get('per_host_concurrency', 1)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers) if self.max_workers > 1 else None
+        self._host_limits = {}
+        self._host_limits_lock = threading.Lock()
 
     def search_product(self, article: str) -> dict[str, str | None]:
-        descriptions = []
-        for competitor in config.CONFIG['competitors']:
-            try:
-                search_url = self._get_search_url(competitor, article)
-                response = self.session.get(search_url)
-                response.raise_for_status()
-
-                soup = BeautifulSoup(response.text, 'html.parser')
-
-                product_url = self._find_product_page(soup, competitor, article)
-                if product_url:
-                    product_description = self._get_product_description(competitor, product_url)
-                    if product_description:
-                        descriptions.append(product_description)
-                else:
-                    print(f"Product {article} not found on {competitor}")
-
-            except Exception as e:
-                print(f"Error searching on {competitor} with query '{article}': {str(e)}")
-                continue
+        competitors = config.CONFIG['competitors']
+        if self.executor:
+            # Опрашиваем всех конкурентов параллельно, порядок результатов сохраняется
+            futures = [self.executor.submit(self._search_competitor, competitor, article) for competitor in competitors]
+            results = [future.result() for future in futures]
+        else:
+            results = [self._search_competitor(competitor, article) for competitor in competitors]
 
+        descriptions = [description for description in results if description]
         if descriptions:
             combined_meta_description = self._combined_meta_description(descriptions)
             return combined_meta_description
 
+    def _search_competitor(self, competitor: str, article: str) -> Optional[dict[str, str | None]]:
+        with METRICS.timer('competitor_search_seconds', host=urlparse(competitor).netloc):
+            description = self._lookup_competitor(competitor, article)
+        METRICS.increment('competitor_lookups_total', host=urlparse(competitor).netloc,
+                          result='found' if description else 'not_found')
+        return description
+
+    def _lookup_competitor(self, competitor: str, article: str) -> Optional[dict[str, str | None]]:
+        if self.url_index:
+            entry = self.url_index.lookup(competitor, article)
+            if entry and entry['url'] is None:
+                print(f"Product {article} not found on {competitor} (cached)")
+                return None
+            if entry:
+                product_description = self._get_product_description(competitor, entry['url'])
+                # При 404 запись удаляется из индекса, тогда ищем товар заново
+                if product_description or self.url_index.lookup(competitor, article):
+                    return product_description
+
+        if self.catalog_index and self.catalog_index.has_competitor(competitor):
+            product_url = self.catalog_index.resolve(competitor, article)
+            if product_url:
+                if self.url_index:
+                    self.url_index.remember(competitor, article, product_url)
+                return self._get_product_description(competitor, product_url)
+            if not self.catalog_index.fallback_to_search:
+                print(f"Product {article} not found on {competitor} (catalog index)")
+                return None
+
+        try:
+            search_url = self._get_search_url(competitor, article)
+            response = self.fetch(search_url)
+            response.raise_for_status()
+
+            with METRICS.timer('html_parse_seconds', host=urlparse(competitor).netloc, page='search'):
+                soup = make_soup(response.text)
+
+            product_url = self._find_product_page(soup, competitor, article)
+            if self.url_index:
+                self.url_index.remember(competitor, article, product_url)
+            if product_url:
+                return self._get_product_description(competitor, product_url)
+            else:
+                print(f"Product {article} not found on {competitor}")
+
+        except Exception as e:
+            print(f"Error searching on {competitor} with query '{article}': {str(e)}")
+            METRICS.increment('competitor_errors_total', host=urlparse(competitor).netloc, error=type(e).__name__)
+        return None
+
+    def fetch(self, url: str) -> requests.Response:
+        """GET с ограничением одновременных запросов к одному сайту"""
+        with self._host_semaphore(url):
+            return self.session.get(url)
+
+    def _host_semaphore(self, url: str) -> threading.BoundedSemaphore:
+        host = urlparse(url).netloc
+        with self._host_limits_lock:
+            if host not in self._host_limits:
+                self._host_limits[host] = threading.BoundedSemaphore(self.per_host_concurrency)
+            return self._host_limits[host]
+
+    def close(self):
+        if self.executor:
+            self.executor.shutdown(wait=True)
+        if self.url_index:
+            self.url_index.close()
+        if self.catalog_index:
+            self.catalog_index.close()
+
     def _get_search_url(self, competitor: str, article: str) -> str | None:
         query = article.replace(' ', '+')
         if 'el-dent.ru' in competitor:
@@ -59,53 +138,96 @@ class CompetitorScraper:
             return f"{competitor}/search?q={query}"
 
     def _find_product_page(self, soup: BeautifulSoup, competitor: str, article: str) -> str | None:
-        """Пытается найти описание на странице товара)"""
-        try:
-            if 'el-dent.ru' in competitor:
-                products = soup.find_all('div', class_='col --product-card')
-                for product in products:
-                    competitor_article = product.find('a', href=True, class_='product__caption').get_text(strip=True)
-                    if article in competitor_article:
-                        link = product.find('a', href=True, class_='product__caption')
-                        if link:
-                            return urljoin(competitor, link['href'])
+        """Пытается найти описание на странице товара).
 
-            elif 'aveldent.ru' in competitor:
-                products = soup.find_all('div', class_='product-thumb transition')
-                for product in products:
-                    competitor_article = product.find('meta', itemprop='mpn', content=True)['content']
-                    if competitor_article == article:
-                        link = product.find('a', href=True, itemprop='url')
-                        if link:
-                            return urljoin(competitor, link['href'])
+        Ошибка разбора выдачи не перехватывается: иначе отсутствие товара запомнилось бы в индексе ссылок.
+        """
+        if 'el-dent.ru' in competitor:
+            products = soup.find_all('div', class_='col --product-card')
+            for product in products:
+                competitor_article = product.find('a', href=True, class_='product__caption').get_text(strip=True)
+                if article in competitor_article:
+                    link = product.find('a', href=True, class_='product__caption')
+                    if link:
+                        return urljoin(competitor, link['href'])
 
-            elif 'www.nika-dent.ru' in competitor:
-                products = soup.find_all('div', class_='product-item loadmore_item')
-                for product in products:
-                    title = product.find('div', class_='descr-block').get_text(strip=True)
-                    if article in title:
-                        link = product.find('div', class_='item-manufacturer').find('a', href=True, class_='item-link')
-                        if link:
-                            return urljoin(competitor, link['href'])
+        elif 'aveldent.ru' in competitor:
+            products = soup.find_all('div', class_='product-thumb transition')
+            for product in products:
+                competitor_article = product.find('meta', itemprop='mpn', content=True)['content']
+                if competitor_article == article:
+                    link = product.find('a', href=True, itemprop='url')
+                    if link:
+                        return urljoin(competitor, link['href'])
 
-            elif 'w-stom.ru' in competitor:
-                products = soup.find_all('div', class_='productTable')
-                if products:
-                    title = products[0].find('div', class_='productColText')
-                    if title:
-                        link = title.find('a', href=True, class_='name')
-                        if link:
-                            return urljoin(competitor, link['href'])
+        elif 'www.nika-dent.ru' in competitor:
+            products = soup.find_all('div', class_='product-item loadmore_item')
+            for product in products:
+                title = product.find('div', class_='descr-block').get_text(strip=True)
+                if article in title:
+                    link = product.find('div', class_='item-manufacturer').find('a', href=True, class_='item-link')
+                    if link:
+                        return urljoin(competitor, link['href'])
 
-        except Exception as e:
-            print(f"Error in direct description check: {str(e)}")
-            return None
+        elif 'w-stom.ru' in competitor:
+            products = soup.find_all('div', class_='productTable')
+            if products:
+                title = products[0].find('div', class_='productColText')
+                if title:
+                    link = title.find('a', href=True, class_='name')
+                    if link:
+                        return urljoin(competitor, link['href'])
+        return None
+
+    def extract_catalog_items(self, soup: BeautifulSoup, competitor: str) -> list[tuple[str, str, bool]]:
+        """Карточки товаров со страницы каталога: (артикул или подпись, URL, точное совпадение)"""
+        items = []
+        if 'el-dent.ru' in competitor:
+            for product in soup.find_all('div', class_='col --product-card'):
+                link = product.find('a', href=True, class_='product__caption')
+                if link:
+                    items.append((link.get_text(strip=True), urljoin(competitor, link['href']), False))
+
+        elif 'aveldent.ru' in competitor:
+            for product in soup.find_all('div', class_='product-thumb transition'):
+                mpn = product.find('meta', itemprop='mpn', content=True)
+                link = product.find('a', href=True, itemprop='url')
+                if mpn and link:
+                    items.append((mpn['content'], urljoin(competitor, link['href']), True))
+
+        elif 'www.nika-dent.ru' in competitor:
+            for product in soup.find_all('div', class_='product-item loadmore_item'):
+                title = product.find('div', class_='descr-block')
+                manufacturer = product.find('div', class_='item-manufacturer')
+                link = manufacturer.find('a', href=True, class_='item-link') if manufacturer else None
+                if title and link:
+                    items.append((title.get_text(strip=True), urljoin(competitor, link['href']), False))
+
+        # w-stom.ru в поиске не показывает артикулы, такой каталог не индексируется
+        return items
 
     def _get_product_description(self, competitor: str, url: str) -> Optional[dict[str, str | None]]:
         try:
-            response = self.session.get(url)
+            response = self.fetch(url)
+            if response.status_code == 404 and self.url_index:
+                self.url_index.invalidate_url(competitor, url)
             response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
+            with METRICS.timer('html_parse_seconds', host=urlparse(competitor).netloc, page='product'):
+                return self._parse_product_description(competitor, response.text)
+        except Exception as e:
+            METRICS.increment('competitor_errors_total', host=urlparse(competitor).netloc, error=type(e).__name__)
+            return None
+
+    @staticmethod
+    def _description_targets(competitor: str) -> Optional[list[str]]:
+        for site, targets in DESCRIPTION_TARGETS.items():
+            if site in competitor:
+                return targets
+        return None
+
+    def _parse_product_description(self, competitor: str, html: str) -> Optional[dict[str, str | None]]:
+        try:
+            soup = make_soup(html, self._description_targets(competitor))
             if 'el-dent.ru' in competitor:
                 meta_keywords = soup.find('meta', attrs={'name': 'keywords', 'content': True})['content']
                 meta_description = soup.find('meta', attrs={'name': 'description', 'content': True})['content']
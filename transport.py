@@ -0,0 +1,99 @@
+from typing import Dict, Optional, Tuple
+from urllib3.util import Retry, make_headers
+from http_cache import CachedSession, HttpCache
+from rate_limiter import HostRateLimiter, RateLimitedAdapter
+import config
+
+DEFAULT_TIMEOUT = (5, 30)
+
+
+class TransportAdapter(RateLimitedAdapter):
+    """HTTPAdapter с таймаутами по умолчанию, повторами urllib3 и ограничением частоты запросов"""
+
+    def __init__(self, rate_limiter: Optional[HostRateLimiter] = None, timeout: Tuple[float, float] = DEFAULT_TIMEOUT,
+                 throttle_retries: int = 2, **kwargs):
+        super().__init__(rate_limiter, throttle_retries, **kwargs)
+        self.timeout = timeout
+
+    def send(self, request, **kwargs):
+        # Без таймаута зависший сайт конкурента останавливает весь прогон
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        return super().send(request, **kwargs)
+
+
+class HttpTransport:
+    """Общий HTTP-транспорт для парсера, сборщика и генератора: пулы соединений, кэш, таймауты, повторы"""
+
+    def __init__(self, cache: Optional[HttpCache] = None, rate_limiter: Optional[HostRateLimiter] = None,
+                 timeout: Tuple[float, float] = DEFAULT_TIMEOUT, pool_maxsize: int = 10, retries: int = 3,
+                 backoff_factor: float = 0.5, throttle_retries: int = 2, hosts: Optional[Dict[str, Dict]] = None):
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+        self.headers = make_headers(keep_alive=True, accept_encoding=True)
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.throttle_retries = throttle_retries
+        self.default_adapter, self.host_adapters = self._build_adapters(timeout, pool_maxsize, hosts, throttle_retries)
+        # Для клиентов со своими повторами 429/503 (GigaChat): повтор в адаптере умножил бы число попыток
+        self.single_try_adapters = self._build_adapters(timeout, pool_maxsize, hosts, 0)
+
+    @classmethod
+    def from_config(cls) -> 'HttpTransport':
+        settings = config.CONFIG.get('transport', {})
+        return cls(
+            cache=HttpCache.from_config(),
+            rate_limiter=HostRateLimiter.from_config(),
+            timeout=tuple(settings.get('timeout', DEFAULT_TIMEOUT)),
+            pool_maxsize=settings.get('pool_maxsize', 10),
+            retries=settings.get('retries', 3),
+            backoff_factor=settings.get('backoff_factor', 0.5),
+            throttle_retries=config.CONFIG.get('rate_limiter', {}).get('throttle_retries', 2),
+            hosts=settings.get('hosts'),
+        )
+
+    def _build_adapters(self, timeout: Tuple[float, float], pool_maxsize: int, hosts: Optional[Dict[str, Dict]],
+                        throttle_retries: int) -> Tuple[TransportAdapter, Dict[str, TransportAdapter]]:
+        # Отдельный пул соединений для хостов с собственными настройками
+        host_adapters = {
+            host: self._build_adapter(tuple(settings.get('timeout', timeout)), settings.get('pool_maxsize', pool_maxsize),
+                                      throttle_retries)
+            for host, settings in (hosts or {}).items()
+        }
+        return self._build_adapter(timeout, pool_maxsize, throttle_retries), host_adapters
+
+    def _build_adapter(self, timeout: Tuple[float, float], pool_maxsize: int,
+                       throttle_retries: int) -> TransportAdapter:
+        # 429/503 обрабатывает RateLimitedAdapter, здесь только сетевые ошибки и 5xx; POST не повторяем
+        retry = Retry(
+            total=self.retries,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=(500, 502, 504),
+            allowed_methods=frozenset({'GET', 'HEAD'}),
+            raise_on_status=False,
+        )
+        return TransportAdapter(self.rate_limiter, timeout, throttle_retries,
+                                pool_maxsize=pool_maxsize, max_retries=retry)
+
+    def session(self, headers: Optional[Dict[str, str]] = None, retry_throttled: bool = True) -> CachedSession:
+        """retry_throttled=False - адаптер не повторяет 429/503, повторы остаются вызывающему коду"""
+        default_adapter, host_adapters = ((self.default_adapter, self.host_adapters) if retry_throttled
+                                          else self.single_try_adapters)
+        session = CachedSession(self.cache)
+        session.headers.update(self.headers)
+        if headers:
+            session.headers.update(headers)
+        session.mount('http://', default_adapter)
+        session.mount('https://', default_adapter)
+        for host, adapter in host_adapters.items():
+            session.mount(f'http://{host}/', adapter)
+            session.mount(f'https://{host}/', adapter)
+        return session
+
+    def close(self):
+        for default_adapter, host_adapters in ((self.default_adapter, self.host_adapters), self.single_try_adapters):
+            default_adapter.close()
+            for adapter in host_adapters.values():
+                adapter.close()
+        if self.cache:
+            self.cache.close()
@@ -0,0 +1,58 @@
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+import config
+
+
+class ProductUrlIndex:
+    """Постоянный индекс (конкурент, артикул) -> URL товара, включая отрицательные записи с TTL"""
+
+    def __init__(self, path: str, negative_ttl: float = 7 * 86400):
+        self.path = path
+        self.negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS product_urls ('
+            'competitor TEXT, article TEXT, url TEXT, updated_at REAL, '
+            'PRIMARY KEY (competitor, article))'
+        )
+        self._conn.commit()
+
+    @classmethod
+    def from_config(cls) -> Optional['ProductUrlIndex']:
+        settings = config.CONFIG.get('url_index', {})
+        if not settings.get('enabled'):
+            return None
+        return cls(settings.get('path', 'url_index.sqlite'), settings.get('negative_ttl', 7 * 86400))
+
+    def lookup(self, competitor: str, article: str) -> Optional[Dict[str, Optional[str]]]:
+        """Возвращает {'url': ...} для известной пары; url = None означает, что товара у конкурента нет"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT url, updated_at FROM product_urls WHERE competitor = ? AND article = ?', (competitor, article)
+            ).fetchone()
+        if not row:
+            return None
+        url, updated_at = row
+        if url is None and time.time() - updated_at >= self.negative_ttl:
+            return None
+        return {'url': url}
+
+    def remember(self, competitor: str, article: str, url: Optional[str]):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO product_urls VALUES (?, ?, ?, ?)', (competitor, article, url, time.time())
+            )
+            self._conn.commit()
+
+    def invalidate_url(self, competitor: str, url: str):
+        with self._lock:
+            self._conn.execute('DELETE FROM product_urls WHERE competitor = ? AND url = ?', (competitor, url))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
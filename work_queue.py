@@ -0,0 +1,167 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import config
+
+
+def shard_of(article_number: str, shards: int) -> int:
+    # Стабильный хэш: один и тот же артикул попадает в один шард на любой машине и при любом запуске
+    digest = hashlib.md5(str(article_number).encode('utf-8')).digest()
+    return int.from_bytes(digest[:4], 'big') % shards
+
+
+class WorkQueue:
+    """Общая очередь товаров для нескольких процессов main.py --worker, в том числе на разных машинах.
+
+    Товар выдаётся воркеру в аренду на lease_seconds; если воркер упал, по истечении аренды товар заберёт другой.
+    Строки таблицы сохраняются в этой же базе и выгружаются одной командой --merge.
+    """
+
+    def __init__(self, path: str, shards: int = 16, lease_seconds: float = 600, max_attempts: int = 3):
+        self.path = path
+        self.shards = max(1, shards)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        # WAL требует общей памяти и не работает на сетевом диске - используется обычный журнал с ожиданием блокировки
+        self._conn = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=DELETE')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS tasks ('
+            'key TEXT PRIMARY KEY, shard INTEGER, product TEXT, status TEXT, owner TEXT, lease_until REAL, '
+            'attempts INTEGER, result TEXT, error TEXT, merged INTEGER, updated_at REAL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS tasks_claim ON tasks (status, shard)')
+
+    @classmethod
+    def from_config(cls) -> 'WorkQueue':
+        settings = config.CONFIG.get('work_queue', {})
+        return cls(settings.get('path', 'work_queue.sqlite'), settings.get('shards', 16),
+                   settings.get('lease_seconds', 600), settings.get('max_attempts', 3))
+
+    def enqueue(self, products: Iterable[Tuple[str, Dict[str, str]]]) -> int:
+        """Добавляет товары (ключ, товар); уже поставленные в очередь не трогает"""
+        added = 0
+        for key, product in products:
+            with self._lock:
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO tasks VALUES (?, ?, ?, 'pending', NULL, 0, 0, NULL, NULL, 0, ?)",
+                    (key, shard_of(product['article_number'], self.shards),
+                     json.dumps(product, ensure_ascii=False), time.time())
+                )
+            added += cursor.rowcount
+        return added
+
+    def claim(self, owner: str, limit: int, shards: Optional[List[int]] = None) -> List[Tuple[str, Dict[str, str]]]:
+        """Берёт в аренду до limit свободных товаров (или товаров с истёкшей арендой) из указанных шардов"""
+        now = time.time()
+        query = ("SELECT key, product FROM tasks WHERE attempts < ? AND "
+                 "(status = 'pending' OR (status = 'leased' AND lease_until < ?))")
+        params = [self.max_attempts, now]
+        if shards:
+            query += f" AND shard IN ({', '.join('?' * len(shards))})"
+            params += shards
+        query += ' ORDER BY shard, key LIMIT ?'
+        params.append(limit)
+        with self._lock:
+            # BEGIN IMMEDIATE блокирует запись сразу: два воркера не получат один и тот же товар
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._fail_expired(now)
+                rows = self._conn.execute(query, params).fetchall()
+                self._conn.executemany(
+                    "UPDATE tasks SET status = 'leased', owner = ?, lease_until = ?, attempts = attempts + 1, "
+                    "updated_at = ? WHERE key = ?",
+                    [(owner, now + self.lease_seconds, now, key) for key, _ in rows]
+                )
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        return [(key, json.loads(product)) for key, product in rows]
+
+    def _fail_expired(self, now: float):
+        # Аренда истекла, а попыток больше нет: иначе товар навсегда остался бы в статусе leased
+        self._conn.execute(
+            "UPDATE tasks SET status = 'failed', owner = NULL, error = COALESCE(error, 'Lease expired'), "
+            "updated_at = ? WHERE status = 'leased' AND lease_until < ? AND attempts >= ?",
+            (now, now, self.max_attempts)
+        )
+
+    def renew(self, owner: str):
+        """Продлевает аренду всех товаров воркера"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE tasks SET lease_until = ? WHERE owner = ? AND status = 'leased'",
+                (now + self.lease_seconds, owner)
+            )
+
+    def complete(self, owner: str, key: str, result: Optional[Dict[str, str]] = None):
+        """Товар обработан; result - строка таблицы или None, если строки нет (нет описаний конкурентов и т.п.).
+
+        Запись только пока аренда у этого воркера: опоздавший воркер не перезапишет чужой результат.
+        """
+        with self._lock:
+            self._conn.execute(
+                "UPDATE tasks SET status = 'done', result = ?, error = NULL, merged = 0, updated_at = ? "
+                "WHERE key = ? AND owner = ? AND status = 'leased'",
+                (json.dumps(result, ensure_ascii=False) if result is not None else None, time.time(), key, owner)
+            )
+
+    def fail(self, owner: str, key: str, error: str):
+        # Товар возвращается в очередь, пока не исчерпаны попытки
+        with self._lock:
+            self._conn.execute(
+                "UPDATE tasks SET status = CASE WHEN attempts < ? THEN 'pending' ELSE 'failed' END, "
+                "owner = NULL, error = ?, updated_at = ? WHERE key = ? AND owner = ? AND status = 'leased'",
+                (self.max_attempts, error, time.time(), key, owner)
+            )
+
+    def release(self, owner: str, keys: Iterable[str]):
+        """Возвращает необработанные товары в очередь без учёта попытки (остановка воркера)"""
+        self._write_many(
+            "UPDATE tasks SET status = 'pending', owner = NULL, attempts = attempts - 1, updated_at = ? "
+            "WHERE key = ? AND owner = ? AND status = 'leased'",
+            [(time.time(), key, owner) for key in keys]
+        )
+
+    def iter_results(self, include_merged: bool = False) -> Iterator[Tuple[str, Dict[str, str]]]:
+        query = "SELECT key, result FROM tasks WHERE status = 'done' AND result IS NOT NULL"
+        if not include_merged:
+            query += ' AND merged = 0'
+        with self._lock:
+            rows = self._conn.execute(query + ' ORDER BY shard, key').fetchall()
+        for key, result in rows:
+            yield key, json.loads(result)
+
+    def mark_merged(self, keys: Iterable[str]):
+        self._write_many('UPDATE tasks SET merged = 1 WHERE key = ?', [(key,) for key in keys])
+
+    def _write_many(self, query: str, params: List[tuple]):
+        # Одна транзакция на всю пачку вместо отдельной записи на диск на каждую строку
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._conn.executemany(query, params)
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def summary(self) -> Dict[str, int]:
+        now = time.time()
+        with self._lock:
+            self._fail_expired(now)
+            rows = self._conn.execute(
+                "SELECT CASE WHEN status = 'leased' AND lease_until < ? THEN 'expired' ELSE status END, COUNT(*) "
+                "FROM tasks GROUP BY 1", (now,)
+            ).fetchall()
+        return dict(rows)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()